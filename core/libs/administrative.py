@@ -0,0 +1,94 @@
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+
+from core.structures.account.models import (Province, Regency,
+                                            ADMINISTRATIVE_VERSION_KEY)
+
+
+class AdministrativeIndex(object):
+    """
+    Process local index of provinces and regencies. The tables are loaded
+    once and reloaded when the shared version in the cache changes, which
+    is checked at most every ADMINISTRATIVE_INDEX_CHECK_INTERVAL seconds.
+    Without a shared cache (e.g. DummyCache) the tables stay loaded until a
+    row is changed in this process.
+    """
+
+    def __init__(self, check_interval=None):
+        self.check_interval = check_interval or getattr(
+            settings, 'ADMINISTRATIVE_INDEX_CHECK_INTERVAL', 30)
+        self.lock = threading.Lock()
+        self.version = None
+        self.loaded = False
+        self.checked_at = 0
+        self.provinces = {}
+        self.regencies = {}
+        self.province_regencies = {}
+
+    def _load(self):
+        provinces = {p.id: p for p in Province.objects.order_by('pk')}
+        regencies = {}
+        province_regencies = {pk: [] for pk in provinces}
+        for regency in Regency.objects.order_by('pk'):
+            regency.province = provinces.get(regency.province_id)
+            regencies[regency.id] = regency
+            province_regencies.setdefault(regency.province_id, []).append(regency)
+
+        self.provinces = provinces
+        self.regencies = regencies
+        self.province_regencies = province_regencies
+
+    def check(self):
+        now = time.monotonic()
+        if self.loaded and now - self.checked_at < self.check_interval:
+            return
+
+        cache.add(ADMINISTRATIVE_VERSION_KEY, uuid.uuid4().hex, None)
+        # no shared version, keep the one this process loaded
+        version = cache.get(ADMINISTRATIVE_VERSION_KEY) or self.version or 'local'
+        with self.lock:
+            if not self.loaded or version != self.version:
+                self._load()
+                self.version = version
+                self.loaded = True
+            self.checked_at = now
+
+    def invalidate(self, **kwargs):
+        self.loaded = False
+
+    def get_province(self, pk):
+        self.check()
+        return self.provinces.get(int(pk)) if pk else None
+
+    def get_regency(self, pk):
+        self.check()
+        return self.regencies.get(int(pk)) if pk else None
+
+    def get_provinces(self):
+        self.check()
+        return list(self.provinces.values())
+
+    def get_regencies(self, province_id=None):
+        self.check()
+        if province_id is None:
+            return list(self.regencies.values())
+        return list(self.province_regencies.get(int(province_id), []))
+
+    def get_province_choices(self):
+        return [(p.id, p.name) for p in self.get_provinces()]
+
+    def get_regency_choices(self, province_id=None):
+        return [(r.id, r.name) for r in self.get_regencies(province_id)]
+
+
+administrative_index = AdministrativeIndex()
+
+for _model in (Province, Regency):
+    post_save.connect(administrative_index.invalidate, sender=_model,
+                      dispatch_uid='administrative_index_%s' % _model.__name__)
+    post_delete.connect(administrative_index.invalidate, sender=_model,
+                        dispatch_uid='administrative_index_delete_%s' % _model.__name__)
@@ -0,0 +1,41 @@
+# numpy is imported in the functions, only dividend runs need it
+
+
+def allocate_pro_rata(total, weights):
+    """
+    Splits the integer `total` over `weights` proportionally, returns an
+    int64 array summing exactly to `total`. Every part is rounded down and
+    the units left over go to the largest remainders (ties to the first).
+    """
+    import numpy as np
+
+    weights = np.asarray(weights, dtype=np.int64)
+    weight_sum = int(weights.sum())
+    if total < 0:
+        raise Exception("Total must not be negative")
+    if weight_sum <= 0:
+        raise Exception("Weights must sum to a positive number")
+    if total * int(weights.max()) >= 2 ** 63:
+        raise Exception("Total is too large to allocate")
+
+    exact = weights * np.int64(total)
+    parts = exact // weight_sum
+    remainders = exact % weight_sum
+
+    leftover = total - int(parts.sum())
+    if leftover:
+        order = np.argsort(-remainders, kind='stable')
+        parts[order[:leftover]] += 1
+    return parts
+
+
+def sum_by_key(keys, values):
+    """
+    Returns (unique keys, summed values) for parallel arrays
+    """
+    import numpy as np
+
+    unique, inverse = np.unique(np.asarray(keys), return_inverse=True)
+    totals = np.zeros(len(unique), dtype=np.int64)
+    np.add.at(totals, inverse, np.asarray(values, dtype=np.int64))
+    return unique, totals
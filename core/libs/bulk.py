@@ -0,0 +1,39 @@
+from django.contrib.sites.models import Site
+from django.utils import timezone
+
+from enterprise.libs.base62 import base62_encode
+from enterprise.libs.moment import to_timestamp
+
+
+def prepare_bulk_create(objs, now=None):
+    """
+    Fills the fields BaseModelGeneric.save() would set, as bulk_create
+    does not call save(). `created_by` must be set on every object.
+    """
+    now = now or timezone.now()
+    timestamp = to_timestamp(now)
+    site = Site.objects.get_current()
+    for obj in objs:
+        obj.site = site
+        obj.created_at = now
+        obj.created_at_timestamp = timestamp
+        obj.owned_by_id = obj.created_by_id
+        obj.owned_at = now
+        obj.owned_at_timestamp = timestamp
+        obj.updated_at = now
+        obj.updated_at_timestamp = timestamp
+    return objs
+
+
+def bulk_create_generic(model, objs, batch_size=500, using=None):
+    """
+    bulk_create for BaseModelGeneric models, also generates id62 once the
+    primary keys are known.
+    """
+    objs = prepare_bulk_create(list(objs))
+    manager = model.objects.db_manager(using)
+    created = manager.bulk_create(objs, batch_size=batch_size)
+    for obj in created:
+        obj.id62 = base62_encode(obj.id)
+    manager.bulk_update(created, ['id62'], batch_size=batch_size)
+    return created
@@ -0,0 +1,85 @@
+from functools import lru_cache
+from types import MappingProxyType
+from django.db.models.signals import class_prepared
+from django.dispatch import receiver
+from django.utils.translation import get_language
+
+from core.libs import constant
+
+
+def _get_choices_names():
+    return [name for name in dir(constant) if name.endswith('_CHOICES')]
+
+
+# id -> label of every *_CHOICES tuple, built once at import. Choices which
+# are not plain tuples (e.g. the pycountry ones) are built on first access.
+CHOICE_LABELS = {
+    name: MappingProxyType(dict(getattr(constant, name)))
+    for name in _get_choices_names()
+    if isinstance(getattr(constant, name), tuple)
+}
+_CHOICE_VALUES = {}
+
+
+def get_choices_labels(name):
+    """
+    Returns the frozen id -> label map of constant.<name>
+    """
+    labels = CHOICE_LABELS.get(name)
+    if labels is None:
+        labels = CHOICE_LABELS[name] = MappingProxyType(
+            dict(getattr(constant, name)))
+    return labels
+
+
+def get_choices_values(name):
+    """
+    Returns the frozen label -> id map of constant.<name>, labels are
+    translated with the active language
+    """
+    key = (name, get_language())
+    values = _CHOICE_VALUES.get(key)
+    if values is None:
+        values = _CHOICE_VALUES[key] = MappingProxyType({
+            str(label): value
+            for value, label in get_choices_labels(name).items()
+        })
+    return values
+
+
+def get_label(name, value, default=None):
+    return get_choices_labels(name).get(value, default)
+
+
+def get_value(name, label, default=None):
+    return get_choices_values(name).get(str(label), default)
+
+
+@lru_cache(maxsize=None)
+def get_field_labels(field):
+    return MappingProxyType(dict(field.flatchoices))
+
+
+def _make_label_getter(field):
+    def get_label(self):
+        return get_field_labels(field).get(getattr(self, field.attname))
+    get_label.__name__ = 'get_%s_label' % field.name
+    return get_label
+
+
+class ChoiceLabelMixin(object):
+    """
+    Adds get_<field>_label() for every choice field of the model, labels
+    come from a map built once per field instead of a dict per call.
+    """
+
+
+@receiver(class_prepared)
+def add_label_getters(sender, **kwargs):
+    if not issubclass(sender, ChoiceLabelMixin):
+        return
+
+    for field in sender._meta.fields:
+        name = 'get_%s_label' % field.name
+        if field.choices and not hasattr(sender, name):
+            setattr(sender, name, _make_label_getter(field))
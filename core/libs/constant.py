@@ -19,15 +19,87 @@
 
 from django.utils.translation import gettext_lazy as _
 from decimal import Decimal
-import pycountry
-
-COUNTRY_CHOICES = [(country.alpha_3, country.name)
-                   for country in list(pycountry.countries)]
-COUNTRY_KEYS = [country.alpha_3 for country in list(pycountry.countries)]
-CURRENCY_CHOICES = [(currency.alpha_3, currency.name)
-                    for currency in list(pycountry.currencies)]
-LANGUAGE_CHOICES = [(language.alpha_3, language.name)
-                    for language in list(pycountry.languages)]
+import json
+import os
+import threading
+
+PYCOUNTRY_SNAPSHOT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'pycountry.json')
+
+
+class LazyChoices(list):
+    """
+    List filled by `loader` on first access, so importing this module does
+    not load the pycountry databases
+    """
+
+    def __init__(self, loader):
+        super(LazyChoices, self).__init__()
+        self._loader = loader
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    list.extend(self, self._loader())
+                    self._loaded = True
+        return self
+
+    def __reduce_ex__(self, protocol):
+        # pickle and copy as a plain list
+        return (list, (list(self._load()),))
+
+    def __radd__(self, other):
+        # `BLANK_CHOICE + COUNTRY_CHOICES`, list concatenation would read
+        # the still empty storage
+        if not isinstance(other, list):
+            return NotImplemented
+        return list.__add__(other, self._load())
+
+
+def _load_first(method):
+    def wrapper(self, *args, **kwargs):
+        self._load()
+        return method(self, *args, **kwargs)
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+
+for _name in ('__iter__', '__len__', '__getitem__', '__contains__',
+              '__reversed__', '__eq__', '__ne__', '__lt__', '__le__', '__gt__',
+              '__ge__', '__add__', '__mul__', '__rmul__', '__repr__', 'index',
+              'count', 'copy', '__iadd__', '__imul__', '__setitem__',
+              '__delitem__', 'append', 'extend', 'insert', 'pop', 'remove',
+              'clear', 'sort', 'reverse'):
+    setattr(LazyChoices, _name, _load_first(getattr(list, _name)))
+
+
+_pycountry_snapshot = None
+
+
+def _get_pycountry(name):
+    """
+    Returns (alpha_3, name) pairs of a pycountry database, from the compact
+    snapshot when it was built (core.scripts.pycountry_snapshot)
+    """
+    global _pycountry_snapshot
+    if _pycountry_snapshot is None and os.path.exists(PYCOUNTRY_SNAPSHOT):
+        with open(PYCOUNTRY_SNAPSHOT, mode='r') as f:
+            _pycountry_snapshot = json.load(f)
+    if _pycountry_snapshot:
+        return [tuple(item) for item in _pycountry_snapshot[name]]
+
+    import pycountry
+    return [(item.alpha_3, item.name) for item in getattr(pycountry, name)]
+
+
+COUNTRY_CHOICES = LazyChoices(lambda: _get_pycountry('countries'))
+COUNTRY_KEYS = LazyChoices(
+    lambda: [key for key, name in _get_pycountry('countries')])
+CURRENCY_CHOICES = LazyChoices(lambda: _get_pycountry('currencies'))
+LANGUAGE_CHOICES = LazyChoices(lambda: _get_pycountry('languages'))
 
 GENDER_CHOICES = (
     (1, _('Male')),
@@ -338,7 +410,25 @@ COMPANY_STATUS_CHOICES = (
 CAMPAIGN_STATUS_CHOICES = (
     (1, _("Funding")),
     (2, _("Complete")),
-    (3, _("Dividend"))
+    (3, _("Dividend")),
+    (4, _("Expired"))
+)
+
+CAMPAIGN_ACTION_CHOICES = (
+    ('disbursement', _('Disbursement')),
+    ('refund', _('Refund')),
+)
+
+CAMPAIGN_ACTION_STATUS_CHOICES = (
+    ('queued', _('Queued')),
+    ('done', _('Done')),
+)
+
+EMAIL_STATUS_CHOICES = (
+    ('queued', _('Queued')),
+    ('sending', _('Sending')),
+    ('sent', _('Sent')),
+    ('failed', _('Failed')),
 )
 
 NO_IMAGE_URL = "https://a75f8eca1cb38315333c-678aa23ddc581c009f308cf5d4dc9c11.ssl.cf6.rackcdn.com/defaults/NO_IMAGE.png"
@@ -19,6 +19,7 @@
 
 from django.shortcuts import reverse
 from core.libs.generate_pdf import PA_pdf, MA_pdf
+from core.libs.outbox import queue_mail
 
 '''
 # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++
@@ -39,14 +40,12 @@ from core.libs.generate_pdf import PA_pdf, MA_pdf
 '''
 
 
-import json
 from datetime import date
 from random import randint
-from django.core.mail import EmailMultiAlternatives
-from django.template import loader
 from django.dispatch import receiver
 from django.conf import settings
-from django.db.models.signals import pre_save, post_save
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_init
 
 from enterprise.structures.authentication.models import User, EmailVerification
 
@@ -55,41 +54,24 @@ def send_mail_with_attachment(subject_template_name, email_template_name, html_e
               context, to_email, attachment, filename, from_email=None, mandrill_template=None, mandrill_variables=None,
               cc=[]):
     """
-    Sends a django.core.mail.EmailMultiAlternatives to `to_email`.
+    Queues a django.core.mail.EmailMultiAlternatives to `to_email` with a
+    pdf attachment.
     """
-    if not from_email:
-        from_email = getattr(settings, 'FROM_EMAIL')
-
-    subject = loader.render_to_string(subject_template_name, context)
-
-    # Email subject *must not* contain newlines
-    subject = ''.join(subject.splitlines())
-    body = loader.render_to_string(email_template_name, context)
-
-    headers = {}
-
-    if mandrill_template:
-        headers["X-MC-Template"] = mandrill_template
-
-    if mandrill_variables:
-        headers["X-MC-MergeVars"] = json.dumps(mandrill_variables)
-
-    email_message = EmailMultiAlternatives(
-        subject, body, from_email, [to_email], headers=headers, cc=cc)
-
-    if html_email_template_name is not None:
-        html_email = loader.render_to_string(html_email_template_name, context)
-        email_message.attach_alternative(html_email, 'text/html')
-    
-
-    email_message.attach(filename, attachment, 'application/pdf')
-
-    email_message.send()
-
+    return queue_mail(
+        subject_template_name,
+        email_template_name,
+        html_email_template_name,
+        context,
+        to_email,
+        from_email=from_email,
+        mandrill_template=mandrill_template,
+        mandrill_variables=mandrill_variables,
+        cc=cc,
+        attachments=[(filename, attachment, 'application/pdf')]
+    )
 
 
 def application_submit_email(email, user):
-    from enterprise.libs.email import send_mail
     from django.conf import settings
 
     subject_template_name = 'home/email/application_submit.txt'
@@ -100,7 +82,7 @@ def application_submit_email(email, user):
         'name': user.full_name
     }
 
-    send_mail(
+    queue_mail(
         subject_template_name,
         email_template_name,
         html_email_template_name,
@@ -109,7 +91,6 @@ def application_submit_email(email, user):
     )
 
 def application_approved_email(request, project):
-    from enterprise.libs.email import send_mail
     from django.conf import settings
 
     subject_template_name = 'home/email/application_approved.txt'
@@ -121,7 +102,7 @@ def application_approved_email(request, project):
         'name': project.owned_by.full_name
     }
 
-    send_mail(
+    queue_mail(
         subject_template_name,
         email_template_name,
         html_email_template_name,
@@ -162,7 +143,6 @@ def offer_letter_email(request, project):
 
 
 def application_rejected_email(email, user):
-    from enterprise.libs.email import send_mail
     from django.conf import settings
 
     subject_template_name = 'home/email/application_rejected.txt'
@@ -173,7 +153,7 @@ def application_rejected_email(email, user):
         'name': user.full_name
     }
 
-    send_mail(
+    queue_mail(
         subject_template_name,
         email_template_name,
         html_email_template_name,
@@ -183,7 +163,6 @@ def application_rejected_email(email, user):
 
 
 def application_publish_email(email, user):
-    from enterprise.libs.email import send_mail
     from django.conf import settings
 
     subject_template_name = 'home/email/application_publish.txt'
@@ -194,7 +173,7 @@ def application_publish_email(email, user):
         'name': user.full_name
     }
 
-    send_mail(
+    queue_mail(
         subject_template_name,
         email_template_name,
         html_email_template_name,
@@ -204,7 +183,6 @@ def application_publish_email(email, user):
 
 
 def application_unpublish_email(email, user):
-    from enterprise.libs.email import send_mail
     from django.conf import settings
 
     subject_template_name = 'home/email/application_unpublish.txt'
@@ -215,7 +193,7 @@ def application_unpublish_email(email, user):
         'name': user.full_name
     }
 
-    send_mail(
+    queue_mail(
         subject_template_name,
         email_template_name,
         html_email_template_name,
@@ -225,7 +203,6 @@ def application_unpublish_email(email, user):
 
 
 def application_disbursed_email(email, cc, project):
-    from enterprise.libs.email import send_mail
     from django.conf import settings
 
     subject_template_name = 'home/email/application_disburse.txt'
@@ -236,7 +213,7 @@ def application_disbursed_email(email, cc, project):
         'project' : project
     }
 
-    send_mail(
+    queue_mail(
         subject_template_name,
         email_template_name,
         html_email_template_name,
@@ -247,7 +224,6 @@ def application_disbursed_email(email, cc, project):
 
 
 def account_approved_email(email, user):
-    from enterprise.libs.email import send_mail
     from django.conf import settings
 
     subject_template_name = 'home/email/account_approved.txt'
@@ -258,7 +234,7 @@ def account_approved_email(email, user):
         'name' : user.full_name
     }
 
-    send_mail(
+    queue_mail(
         subject_template_name,
         email_template_name,
         html_email_template_name,
@@ -267,7 +243,6 @@ def account_approved_email(email, user):
     )
 
 def account_rejected_email(email, user, reason):
-    from enterprise.libs.email import send_mail
     from django.conf import settings
 
     subject_template_name = 'home/email/account_rejected.txt'
@@ -279,7 +254,7 @@ def account_rejected_email(email, user, reason):
         'reason' : reason
     }
 
-    send_mail(
+    queue_mail(
         subject_template_name,
         email_template_name,
         html_email_template_name,
@@ -289,7 +264,6 @@ def account_rejected_email(email, user, reason):
 
 
 def account_submission_email(email, user):
-    from enterprise.libs.email import send_mail
     from django.conf import settings
 
     subject_template_name = 'home/email/account_submission.txt'
@@ -300,7 +274,7 @@ def account_submission_email(email, user):
         'name' : user.full_name
     }
 
-    send_mail(
+    queue_mail(
         subject_template_name,
         email_template_name,
         html_email_template_name,
@@ -310,7 +284,6 @@ def account_submission_email(email, user):
 
 
 def account_submission_complete_email(email, user):
-    from enterprise.libs.email import send_mail
     from django.conf import settings
 
     subject_template_name = 'home/email/account_submission_complete.txt'
@@ -321,7 +294,7 @@ def account_submission_complete_email(email, user):
         'name' : user.full_name
     }
 
-    send_mail(
+    queue_mail(
         subject_template_name,
         email_template_name,
         html_email_template_name,
@@ -331,7 +304,6 @@ def account_submission_complete_email(email, user):
 
 
 def topup_requested_email(email, user, topup):
-    from enterprise.libs.email import send_mail
     from django.conf import settings
 
     subject_template_name = 'home/email/topup_requested.txt'
@@ -352,7 +324,7 @@ def topup_requested_email(email, user, topup):
             topup.invoice.number)
     }
 
-    send_mail(
+    queue_mail(
         subject_template_name,
         email_template_name,
         html_email_template_name,
@@ -362,7 +334,6 @@ def topup_requested_email(email, user, topup):
 
 
 def topup_approved_email(email, user, topup):
-    from enterprise.libs.email import send_mail
     from django.conf import settings
 
     subject_template_name = 'home/email/topup_approved.txt'
@@ -374,7 +345,7 @@ def topup_approved_email(email, user, topup):
         'amount' : topup.get_formatted_amount(),
     }
 
-    send_mail(
+    queue_mail(
         subject_template_name,
         email_template_name,
         html_email_template_name,
@@ -384,7 +355,6 @@ def topup_approved_email(email, user, topup):
 
 
 def topup_rejected_email(email, user, topup):
-    from enterprise.libs.email import send_mail
     from django.conf import settings
 
     subject_template_name = 'home/email/topup_rejected.txt'
@@ -396,7 +366,7 @@ def topup_rejected_email(email, user, topup):
         'amount' : topup.get_formatted_amount(),
     }
 
-    send_mail(
+    queue_mail(
         subject_template_name,
         email_template_name,
         html_email_template_name,
@@ -406,7 +376,6 @@ def topup_rejected_email(email, user, topup):
 
 
 def withdraw_approved_email(email, user, withdraw):
-    from enterprise.libs.email import send_mail
     from django.conf import settings
 
     subject_template_name = 'home/email/withdraw_approved.txt'
@@ -418,7 +387,7 @@ def withdraw_approved_email(email, user, withdraw):
         'amount' : withdraw.get_formatted_amount(),
     }
 
-    send_mail(
+    queue_mail(
         subject_template_name,
         email_template_name,
         html_email_template_name,
@@ -428,7 +397,6 @@ def withdraw_approved_email(email, user, withdraw):
 
 
 def withdraw_rejected_email(email, user, withdraw):
-    from enterprise.libs.email import send_mail
     from django.conf import settings
 
     subject_template_name = 'home/email/withdraw_rejected.txt'
@@ -440,7 +408,7 @@ def withdraw_rejected_email(email, user, withdraw):
         'amount' : withdraw.get_formatted_amount(),
     }
 
-    send_mail(
+    queue_mail(
         subject_template_name,
         email_template_name,
         html_email_template_name,
@@ -452,7 +420,6 @@ def withdraw_rejected_email(email, user, withdraw):
 def funding_sent_email(request, email, user):
     # from enterprise.libs.email import send_mail
     from django.conf import settings
-    from enterprise.libs.email import send_mail
 
     subject_template_name = 'home/email/funding_sent.txt'
     html_email_template_name = 'home/email/funding_sent.html'
@@ -479,7 +446,7 @@ def funding_sent_email(request, email, user):
     # )
 
 
-    send_mail(
+    queue_mail(
         subject_template_name,
         email_template_name,
         html_email_template_name,
@@ -488,7 +455,6 @@ def funding_sent_email(request, email, user):
     )
 
 def repayment_email(email, cc, payment):
-    from enterprise.libs.email import send_mail
     from django.conf import settings
 
     subject_template_name = 'home/email/repayment.txt'
@@ -500,7 +466,7 @@ def repayment_email(email, cc, payment):
         'project' : payment.project,
     }
 
-    send_mail(
+    queue_mail(
         subject_template_name,
         email_template_name,
         html_email_template_name,
@@ -510,7 +476,6 @@ def repayment_email(email, cc, payment):
     )
 
 def send_verification_email(email, user, length=6, base_url=None, *args, **kwargs):
-    from enterprise.libs.email import send_mail
     from django.conf import settings
 
     subject_template_name = "email/email_verify.txt"
@@ -530,7 +495,7 @@ def send_verification_email(email, user, length=6, base_url=None, *args, **kwarg
         "name": user.full_name
     }
 
-    send_mail(
+    queue_mail(
         subject_template_name,
         email_template_name,
         html_email_template_name,
@@ -543,34 +508,59 @@ def send_verification_email(email, user, length=6, base_url=None, *args, **kwarg
     )
     ev.code = code
     ev.is_verified = False
+    if user.pk:
+        ev.user = user
     ev.save()
 
     return ev
 
 
+def schedule_verification_email(email, user):
+    """
+    Sends the verification once the transaction commits, the callback is
+    dropped with it on rollback. When the email changes again before the
+    commit only the last address gets a verification.
+    """
+    def send():
+        if user.email == email:
+            send_verification_email(email, user)
+
+    transaction.on_commit(send)
+
+
+@receiver(post_init, sender=User)
+def track_email(sender, instance, **kwargs):
+    # read from __dict__ so a deferred email does not trigger a query
+    instance._original_email = instance.__dict__.get('email')
+
+
 @receiver(pre_save, sender=User)
 def verify_email(sender, instance, **kwargs):
     from django.conf import settings
-    from enterprise.structures.authentication.models import User
-    # import ipdb ; ipdb.set_trace()
 
+    instance._is_email_changed = False
     if getattr(settings, 'AUTO_VERIFY_EMAIL', False):
-        email = instance.email
         if instance.is_sent_email:
-            existed_user = User.objects.filter(id=instance.id).first()
-            if not existed_user:
-                send_verification_email(
-                    email,
-                    instance
-                )
+            if instance._state.adding:
+                instance._is_email_changed = True
             else:
-                if email != existed_user.email:
-                    send_verification_email(email, instance)
+                original_email = getattr(instance, '_original_email', None)
+                if original_email is None:
+                    original_email = User.objects.filter(
+                        id=instance.id).values_list('email', flat=True).first()
+                instance._is_email_changed = instance.email != original_email
 
 
 @receiver(post_save, sender=User)
-def save_ev(sender, instance, **kwargs):
-    ev = EmailVerification.objects.filter(email=instance.email).last()
-    if ev:
-        ev.user = instance
-        ev.save()
\ No newline at end of file
+def save_ev(sender, instance, created, **kwargs):
+    if created:
+        # verifications sent before the user existed
+        ev = EmailVerification.objects.filter(
+            email=instance.email, user__isnull=True).last()
+        if ev:
+            ev.user = instance
+            ev.save()
+    if getattr(instance, '_is_email_changed', False):
+        schedule_verification_email(instance.email, instance)
+    instance._is_email_changed = False
+    instance._original_email = instance.email
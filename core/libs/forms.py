@@ -17,7 +17,6 @@
 '''
 
 
-import nexmo
 import uuid
 from django.conf import settings
 from django.core.exceptions import ValidationError
@@ -26,7 +25,8 @@ from django.contrib.auth.forms import *
 from django.forms import *
 from django.contrib.auth import get_user_model
 from django.utils.translation import gettext, gettext_lazy as _
-from .nonce import NonceObject
+from .nonce import NonceObject, nonce_registry
+from .sms import get_sms_gateway
 
 
 class ErrorDiv(ErrorList):
@@ -129,11 +129,9 @@ class PhoneCheckForm(ModelForm):
         cleaned_data = super().clean()
         phone = self.cleaned_data.get('phone_number')
 
-        client = nexmo.Client(
-            key=settings.NEXMO_API_KEY,
-            secret=settings.NEXMO_API_SECRET)
-        verify_resp = client.start_verification(
-            number=phone, brand='lakon.app')
+        verify_resp = get_sms_gateway().start_verification(
+            number=phone,
+            brand=getattr(settings, 'SMS_VERIFICATION_BRAND', 'lakon.app'))
         if not verify_resp['status'] == '0' and not verify_resp['status'] == '10':
             raise ValidationError(
                 verify_resp['error_text']
@@ -164,10 +162,7 @@ class PhoneVerifyForm(Form):
         cleaned_data = super().clean()
         code = self.cleaned_data.get('code')
         request_id = self.cleaned_data.get('request_id')
-        client = nexmo.Client(
-            key=settings.NEXMO_API_KEY,
-            secret=settings.NEXMO_API_SECRET)
-        response = client.check_verification(request_id, code=code)
+        response = get_sms_gateway().check_verification(request_id, code=code)
 
         if not response['status'] == '0':
             raise ValidationError(
@@ -189,4 +184,9 @@ class NonceModelForm(ModelForm):
         if created_by:
             self.instance.created_by = created_by
 
-        return super(NonceModelForm, self).save(commit=commit)
+        instance = super(NonceModelForm, self).save(commit=False)
+        if commit:
+            # a duplicate submission gets the object stored by the first one
+            instance = self.instance = nonce_registry.save(instance)
+            self._save_m2m()
+        return instance
@@ -1,8 +1,102 @@
+import atexit
 import random
 import string
+import threading
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.libs.base36 import encode, BASE36u
+
+
+CODE_LENGTH = 6
+CODE_SPACE = 36 ** CODE_LENGTH
+# coprime with 36, so sequence -> code is a permutation of the code space and
+# consecutive campaigns do not get consecutive codes
+CODE_MULTIPLIER = 1500450271
 
 
 def generate_campaign_code(length):
     letters = string.ascii_letters
     result_str = ''.join(random.choice(letters) for i in range(length))
     return result_str
+
+
+def encode_campaign_code(sequence):
+    code = encode(sequence * CODE_MULTIPLIER % CODE_SPACE, BASE36u)
+    return code.rjust(CODE_LENGTH, BASE36u[0])
+
+
+class CodeAllocator(object):
+    """
+    Hands out campaign codes from blocks reserved on the CodeSequence row, one
+    database round trip per `block_size` codes. Every sequence number maps to
+    a distinct code, so allocation never has to retry.
+
+    Blocks are reserved on a separate autocommit connection, so the sequence
+    row is not locked until the caller's transaction ends and a rollback
+    does not hand the same block out twice. Database connections are bound
+    to the thread that opened them, so each thread gets its own and closes
+    it when its request finishes.
+    """
+
+    def __init__(self, name='campaign', block_size=None, using=DEFAULT_DB_ALIAS):
+        self.name = name
+        self.block_size = block_size or getattr(
+            settings, 'CAMPAIGN_CODE_BLOCK_SIZE', 100)
+        self.using = using
+        self.lock = threading.Lock()
+        self.codes = []
+        self.local = threading.local()
+
+    def _get_connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            default = connections[self.using]
+            connection = type(default)(default.settings_dict, self.using)
+            self.local.connection = connection
+        connection.close_if_unusable_or_obsolete()
+        return connection
+
+    def close(self, **kwargs):
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            connection.close()
+
+    def _reserve_block(self):
+        from core.structures.investment.models import CodeSequence, CompanyCampaign
+
+        table = CodeSequence._meta.db_table
+        with self._get_connection().cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO {0} (name, value) VALUES (%s, %s) '
+                'ON CONFLICT (name) DO UPDATE SET value = {0}.value + EXCLUDED.value '
+                'RETURNING value'.format(table),
+                [self.name, self.block_size])
+            end = cursor.fetchone()[0]
+        start = end - self.block_size
+        if end >= CODE_SPACE:
+            raise Exception("Campaign codes are exhausted")
+
+        codes = [encode_campaign_code(number) for number in range(
+            start + 1, end + 1)]
+        # skip codes that were generated randomly before the allocator
+        taken = set(CompanyCampaign.objects.using(self.using).filter(
+            code__in=codes).values_list('code', flat=True))
+        return [code for code in reversed(codes) if code not in taken]
+
+    def allocate(self):
+        with self.lock:
+            while not self.codes:
+                self.codes = self._reserve_block()
+            return self.codes.pop()
+
+
+campaign_code_allocator = CodeAllocator()
+request_finished.connect(
+    campaign_code_allocator.close, dispatch_uid='campaign_code_allocator_close')
+atexit.register(campaign_code_allocator.close)
+
+
+def allocate_campaign_code():
+    return campaign_code_allocator.allocate()
@@ -1,6 +1,13 @@
 from __future__ import unicode_literals
 
+import hashlib
+import os
+import tempfile
+from concurrent.futures import Future
 from datetime import date
+from functools import partial
+
+from django.conf import settings
 
 from django.http import HttpResponseRedirect, HttpResponse
 from django.template.loader import render_to_string
@@ -14,56 +21,151 @@ from enterprise.structures.transaction.models import BankAccount
 
 from weasyprint import HTML, CSS
 
-def UA_pdf(request, project):
+from core.libs.pdf_pool import get_pdf_pool, write_pdf
+
+
+class PDFCache(object):
+    """
+    Rendered pdf store on disk keyed by a hash of the html, PDF_STYLESHEETS
+    and PDF_TEMPLATE_VERSION, least recently used files are evicted once the
+    directory grows over PDF_CACHE_MAX_SIZE bytes.
+    """
+
+    def __init__(self, directory=None, max_size=None, version=None):
+        self.directory = directory or getattr(
+            settings, 'PDF_CACHE_DIR',
+            os.path.join(tempfile.gettempdir(), 'pdf-cache'))
+        self.max_size = max_size or getattr(
+            settings, 'PDF_CACHE_MAX_SIZE', 512 * 1024 * 1024)
+        self.version = version or getattr(settings, 'PDF_TEMPLATE_VERSION', '1')
+        self.stylesheets = ','.join(getattr(settings, 'PDF_STYLESHEETS', []))
+
+    def get_key(self, html_string):
+        return hashlib.sha256(('%s:%s:%s' % (
+            self.version, self.stylesheets, html_string)).encode('utf-8')
+        ).hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self.directory, '%s.pdf' % key)
+
+    def get(self, key):
+        path = self.get_path(key)
+        try:
+            with open(path, 'rb') as f:
+                pdf = f.read()
+        except (IOError, OSError):
+            return None
+        try:
+            # mark as recently used, the file may be evicted meanwhile
+            os.utime(path, None)
+        except OSError:
+            pass
+        return pdf
+
+    def set(self, key, pdf):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pdf)
+        os.replace(tmp_path, self.get_path(key))
+        self.evict()
+
+    def evict(self):
+        files = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.pdf'):
+                continue
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        for mtime, size, path in sorted(files):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+pdf_cache = PDFCache()
+
+
+def _cache_pdf(key, future):
+    if not future.cancelled() and future.exception() is None:
+        pdf_cache.set(key, future.result())
+
+
+def render_pdf(template_name, context, base_url, wait=True):
+    """
+    Renders a template to pdf, unchanged documents are served from the cache
+    without running WeasyPrint. With PDF_POOL_ENABLED the render runs on the
+    pdf pool, `wait=False` returns a Future to be passed to wait_pdf.
+    """
+    html_string = render_to_string(template_name, context)
+    key = pdf_cache.get_key(html_string)
+    pdf = pdf_cache.get(key)
+    if pdf is None:
+        if not wait or getattr(settings, 'PDF_POOL_ENABLED', False):
+            future = get_pdf_pool().submit(html_string, base_url)
+            future.add_done_callback(partial(_cache_pdf, key))
+            return wait_pdf(future) if wait else future
+
+        pdf = write_pdf(html_string, base_url)
+        pdf_cache.set(key, pdf)
+
+    if wait:
+        return pdf
+    future = Future()
+    future.set_result(pdf)
+    return future
+
+
+def wait_pdf(future, timeout=None):
+    return future.result(
+        timeout=timeout or getattr(settings, 'PDF_POOL_TIMEOUT', 60))
+
+
+def UA_pdf(request, project, wait=True):
     company = project.company
     bank = BankAccount.objects.filter(owned_by=project.owned_by).first()
     response = HttpResponse(content_type="application/pdf")
 
     # import ipdb ; ipdb.set_trace()
-    html_string = render_to_string("home/email/attachment/underlying-agreement.html", {
+    return render_pdf("home/email/attachment/underlying-agreement.html", {
         'today': date.today(),
         'year': date.today().year,
         'project': project,
         'company': company,
         'bank': bank,
         'ma': project.masteragreement_set.first()
-    })
-    html = HTML(string=html_string, base_url=request.build_absolute_uri())
-    pdf = html.write_pdf()
+    }, request.build_absolute_uri(), wait=wait)
 
-    return pdf
-
-def PA_pdf(request, pa):
+def PA_pdf(request, pa, wait=True):
     fund = pa.fund
     response = HttpResponse(content_type="application/pdf")
 
     # import ipdb ; ipdb.set_trace()
-    html_string = render_to_string("home/email/attachment/participant-agreement.html", {
+    return render_pdf("home/email/attachment/participant-agreement.html", {
         'today': date.today(),
         'year': date.today().year,
         'fund': fund,
         'pa': pa,
-    })
-    html = HTML(string=html_string, base_url=request.build_absolute_uri())
-    pdf = html.write_pdf()
-
-    return pdf
+    }, request.build_absolute_uri(), wait=wait)
 
-def MA_pdf(request, project):
+def MA_pdf(request, project, wait=True):
     company = project.company
     bank = BankAccount.objects.filter(owned_by=project.owned_by).first()
     response = HttpResponse(content_type="application/pdf")
 
     # import ipdb ; ipdb.set_trace()
-    html_string = render_to_string("home/email/attachment/master-agreement.html", {
+    return render_pdf("home/email/attachment/master-agreement.html", {
         'today': date.today(),
         'year': date.today().year,
         'project': project,
         'company': company,
         'bank': bank,
         'ma': project.masteragreement_set.first()
-    })
-    html = HTML(string=html_string, base_url=request.build_absolute_uri())
-    pdf = html.write_pdf()
-
-    return pdf
\ No newline at end of file
+    }, request.build_absolute_uri(), wait=wait)
\ No newline at end of file
@@ -21,7 +21,9 @@ from taggit.managers import TaggableManager, _TaggableManager
 from django.utils import six
 from django.conf import settings
 from django.db import models, router
-from django.db.models import signals, F
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import signals, F, Q, Value
+from django.db.models.functions import Greatest, Lower
 from taggit.utils import (require_instance_manager)
 from core.structures.tag.models import TagGroup
 
@@ -30,69 +32,94 @@ class _TagManager(_TaggableManager):
     @require_instance_manager
     def incr(self, *tags, **kwargs):
         factor = kwargs.get("factor", 1)
-        db = router.db_for_write(self.through, instance=self.instance)
-        tag_objs = self._to_tag_model_instances(tags)
-
-        for tag in tag_objs:
-            obj, created = self.through._default_manager.using(db).get_or_create(
-                tag=tag, **self._lookup_kwargs())
-
-            if created:
-                obj.weight = 1
-            else:
-                obj.weight = obj.weight + factor
-
-            obj.save()
+        self.adjust_weight(*tags, factor=factor)
 
     @require_instance_manager
     def decr(self, *tags, **kwargs):
+        factor = kwargs.get("factor", 1)
+        self.adjust_weight(*tags, factor=-factor)
+
+    @require_instance_manager
+    def adjust_weight(self, *tags, **kwargs):
+        """
+        Adds `factor` (can be negative) to the weight of every given tag in
+        one UPDATE, weight can not be less than 1. Tags which are not attached
+        yet are inserted in one bulk insert with weight 1.
+        """
         factor = kwargs.get("factor", 1)
         db = router.db_for_write(self.through, instance=self.instance)
         tag_objs = self._to_tag_model_instances(tags)
+        if not tag_objs:
+            return
 
-        for tag in tag_objs:
-            obj, created = self.through._default_manager.using(db).get_or_create(
-                tag=tag, **self._lookup_kwargs())
+        manager = self.through._default_manager.using(db)
+        qs = manager.filter(tag__in=tag_objs, **self._lookup_kwargs())
+        existing_ids = set(qs.values_list('tag_id', flat=True))
 
-            if created:
-                obj.weight = 1
-            elif (obj.weight - factor) >= factor:  # can not less than 1
-                obj.weight = obj.weight - factor
-            else:
-                obj.weight = 1
+        qs.update(weight=Greatest(F('weight') + factor, Value(1)))
 
-            obj.save()
+        manager.bulk_create([
+            self.through(tag=tag, weight=1, **self._lookup_kwargs())
+            for tag in tag_objs if tag.pk not in existing_ids
+        ], ignore_conflicts=True)
 
     @require_instance_manager
     def add(self, *tags):
-        db = router.db_for_write(self.through, instance=self.instance)
+        self.add_to_instances([self.instance], *tags)
+
+    def add_to_instances(self, instances, *tags):
+        """
+        Tags every instance with the same tags. Only missing through rows are
+        inserted, in one bulk insert for all instances.
+        """
+        instances = list(dict((i.pk, i) for i in instances).values())
+        if not instances:
+            return
+
+        db = router.db_for_write(self.through, instance=instances[0])
+        manager = self.through._default_manager.using(db)
 
         tag_objs = self._to_tag_model_instances(tags)
-        new_ids = set(t.pk for t in tag_objs)
+        tag_ids = set(t.pk for t in tag_objs)
+
+        lookups = Q()
+        for instance in instances:
+            lookups |= Q(**self.through.lookup_kwargs(instance))
 
         # NOTE: can we hardcode 'tag_id' here or should the column name be got
         # dynamically from somewhere?
-        vals = (self.through._default_manager.using(db)
-                .values_list('tag_id', flat=True)
-                .filter(**self._lookup_kwargs()))
-
-        new_ids = new_ids - set(vals)
-
-        signals.m2m_changed.send(
-            sender=self.through, action="pre_add",
-            instance=self.instance, reverse=False,
-            model=self.through.tag_model(), pk_set=new_ids, using=db,
-        )
+        object_key = self._get_object_key()
+        vals = set(manager.filter(lookups)
+                   .filter(tag_id__in=tag_ids)
+                   .values_list(object_key, 'tag_id'))
+
+        new_ids = {}
+        for instance in instances:
+            new_ids[instance] = set(
+                tag_id for tag_id in tag_ids
+                if (instance.pk, tag_id) not in vals
+            )
 
-        for tag in tag_objs:
-            self.through._default_manager.using(db).get_or_create(
-                tag=tag, **self._lookup_kwargs())
+            signals.m2m_changed.send(
+                sender=self.through, action="pre_add",
+                instance=instance, reverse=False,
+                model=self.through.tag_model(), pk_set=new_ids[instance],
+                using=db,
+            )
 
-        signals.m2m_changed.send(
-            sender=self.through, action="post_add",
-            instance=self.instance, reverse=False,
-            model=self.through.tag_model(), pk_set=new_ids, using=db,
-        )
+        manager.bulk_create([
+            self.through(tag=tag, **self.through.lookup_kwargs(instance))
+            for instance in instances
+            for tag in tag_objs if tag.pk in new_ids[instance]
+        ], ignore_conflicts=True)
+
+        for instance in instances:
+            signals.m2m_changed.send(
+                sender=self.through, action="post_add",
+                instance=instance, reverse=False,
+                model=self.through.tag_model(), pk_set=new_ids[instance],
+                using=db,
+            )
 
     @require_instance_manager
     def remove(self, *tags):
@@ -119,6 +146,16 @@ class _TagManager(_TaggableManager):
             model=self.through.tag_model(), pk_set=old_ids, using=db,
         )
 
+    def _get_object_key(self):
+        """
+        Column of the through model pointing to the tagged object, generic
+        through models use object_id.
+        """
+        try:
+            return self.through._meta.get_field('object_id').attname
+        except FieldDoesNotExist:
+            return self.through._meta.get_field('content_object').attname
+
     def _to_tag_model_instances(self, tags):
         """
         Takes an iterable containing either strings, tag objects, or a mixture
@@ -139,77 +176,116 @@ class _TagManager(_TaggableManager):
                     "Cannot add {0} ({1}). Expected {2} or str.".format(
                         t, type(t), type(self.through.tag_model())))
 
+        if not str_tags:
+            return tag_objs
+
         tag_delimiter = getattr(settings, 'TAGGIT_TAG_DELIMITER', ':')
         case_insensitive = getattr(settings, 'TAGGIT_CASE_INSENSITIVE', True)
         manager = self.through.tag_model()._default_manager.using(db)
 
-        existing = []
-        tags_to_create = []
+        def normalize(pair):
+            if case_insensitive:
+                return tuple(x.lower() for x in pair)
+            return pair
+
+        pairs = set()
+        for raw_name in str_tags:
+            group, name = raw_name.split(tag_delimiter)
+            pairs.add((group, name))
+
+        # fetch every existing tag in one query
+        existing = self._get_existing_tags(manager, pairs, case_insensitive)
+
+        tags_to_create = {}
+        for pair in pairs:
+            tag = existing.get(normalize(pair))
+            if tag:
+                tag_objs.add(tag)
+            else:
+                # "Group:Name" and "group:name" must only create one tag
+                tags_to_create.setdefault(normalize(pair), pair)
+
+        if not tags_to_create:
+            return tag_objs
+
+        # check new groups are existing or not, first record wins
+        groups = {}
+        group_names = set(group for group, name in tags_to_create.values())
+        for group in TagGroup.objects.filter(
+                short_name__in=group_names).order_by('pk'):
+            groups.setdefault(group.short_name, group)
+
+        # ignore if not exist
+        if group_names - set(groups):
+            return
+
+        new_tags = [
+            self.through.tag_model()(group=groups[group], name=name)
+            for group, name in tags_to_create.values()
+        ]
+        tag_objs.update(self._bulk_create_tags(manager, new_tags))
+
+        return tag_objs
 
+    def _get_existing_tags(self, manager, pairs, case_insensitive):
+        """
+        Returns existing tags matching (group short name, name) pairs, keyed
+        by the (lowered when case insensitive) pair.
+        """
+        qs = manager.select_related('group')
         if case_insensitive:
-            # Some databases can do case-insensitive comparison with IN, which
-            # would be faster, but we can't rely on it or easily detect it.
-            for raw_name in str_tags:
-                try:
-                    group, name = raw_name.split(tag_delimiter)
-                    tag = manager.get(
-                        group__short_name__iexact=group,
-                        name__iexact=name
-                    )
-                    existing.append(tag)
-                except self.through.tag_model().DoesNotExist:
-                    tags_to_create.append(raw_name)
+            qs = qs.annotate(
+                group_lower=Lower('group__short_name'),
+                name_lower=Lower('name'),
+            ).filter(
+                group_lower__in=set(group.lower() for group, name in pairs),
+                name_lower__in=set(name.lower() for group, name in pairs),
+            )
         else:
-            # If str_tags has 0 elements Django actually optimizes that to not
-            # do a query.  Malcolm is very smart.
-            for raw_name in str_tags:
-                try:
-                    group, name = raw_name.split(tag_delimiter)
-                    tag = manager.filter(
-                        group__short_name__exact=group,
-                        name__exact=name
-                    )
-                    existing.append(tag)
-                except self.through.tag_model().DoesNotExist:
-                    tags_to_create.append(raw_name)
-
-        tag_objs.update(existing)
-
-        for new_record in tags_to_create:
-            new_group, new_tag = new_record.split(tag_delimiter)
-
-            # check new group is existing or not
-            groups = TagGroup.objects.filter(
-                short_name=new_group
+            qs = qs.filter(
+                group__short_name__in=set(group for group, name in pairs),
+                name__in=set(name for group, name in pairs),
             )
 
-            # ignore if not exist
-            if groups.exists() is False:
-                return
-
-            # get the first record if group is exist
-            group = groups.first()
-
+        existing = {}
+        for tag in qs.order_by('pk'):
+            key = (tag.group.short_name, tag.name)
             if case_insensitive:
-                try:
-                    tag = manager.get(
-                        group__short_name__iexact=new_group,
-                        name__iexact=new_tag
-                    )
-                except self.through.tag_model().DoesNotExist:
-                    tag = manager.create(
-                        group=group,
-                        name=new_tag
-                    )
+                key = tuple(x.lower() for x in key)
+            existing.setdefault(key, tag)
+        return existing
+
+    def _bulk_create_tags(self, manager, tags):
+        """
+        Creates tags with one insert. Tags whose slug is already taken are
+        saved one by one so the model can resolve the collision.
+        """
+        if not hasattr(self.through.tag_model(), 'slugify'):
+            return manager.bulk_create(tags)
+
+        for tag in tags:
+            tag.slug = tag.slugify(tag.name)
+
+        taken = set(manager.filter(
+            slug__in=[tag.slug for tag in tags]
+        ).values_list('slug', flat=True))
+
+        bulk_tags = []
+        single_tags = []
+        for tag in tags:
+            if tag.slug in taken:
+                tag.slug = ''
+                single_tags.append(tag)
             else:
-                tag = manager.create(
-                    group=group,
-                    name=new_tag
-                )
+                taken.add(tag.slug)
+                bulk_tags.append(tag)
 
-            tag_objs.add(tag)
+        created = manager.bulk_create(bulk_tags)
+        for tag in single_tags:
+            tag.save(using=manager.db)
+            created.append(tag)
 
-        return tag_objs
+        return created
 
 
 class TagManager(TaggableManager):
@@ -17,6 +17,47 @@
 '''
 
 
+from django.db import IntegrityError, transaction
+
+
+def _is_nonce_conflict(error):
+    # postgres names the violated constraint, other backends name the column
+    diag = getattr(error.__cause__, 'diag', None)
+    return 'nonce' in (getattr(diag, 'constraint_name', None) or str(error))
+
+
+class NonceRegistry(object):
+    """
+    Looks up and stores objects by nonce. `save` is a get or insert, on
+    models with a unique index on nonce a concurrent duplicate ends up as
+    the already stored object instead of a second row.
+    """
+
+    def get(self, model, nonce):
+        if not nonce:
+            return None
+        return model.objects.filter(nonce=nonce).first()
+
+    def save(self, obj, *args, **kwargs):
+        adding = obj._state.adding
+        try:
+            with transaction.atomic():
+                obj.save(*args, **kwargs)
+        except IntegrityError as e:
+            # only a new row losing the race on its nonce is a duplicate,
+            # any other failure is the caller's
+            if not (adding and obj.nonce and _is_nonce_conflict(e)):
+                raise
+            existing = type(obj).objects.filter(nonce=obj.nonce).first()
+            if existing is None:
+                raise
+            obj = existing
+        return obj
+
+
+nonce_registry = NonceRegistry()
+
+
 class NonceObject(object):
     MODEL = None
     NONCE = None
@@ -25,7 +66,7 @@ class NonceObject(object):
     def __init__(self, *args, **kwargs):
         self.MODEL = kwargs.get("model")
         self.NONCE = kwargs.get("nonce")
-        obj = self.MODEL.objects.filter(nonce=self.NONCE).first()
+        obj = nonce_registry.get(self.MODEL, self.NONCE)
         if not obj:
             obj = self.MODEL(nonce=self.NONCE)
         self.OBJ = obj
@@ -0,0 +1,185 @@
+import json
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.template import loader
+from django.utils import timezone
+
+from core.structures.outbox.models import OutgoingEmail, OutgoingEmailAttachment
+
+
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 60
+MAX_BACKOFF_SECONDS = 60 * 60
+LEASE_SECONDS = 15 * 60
+
+
+def queue_mail(subject_template_name, email_template_name, html_email_template_name,
+               context, to_email, from_email=None, mandrill_template=None, mandrill_variables=None,
+               cc=[], attachments=[]):
+    """
+    Renders the templates now and stores the message in the outbox, it will
+    be delivered by the send_queued_mail command.
+    `attachments` is a list of (filename, content, mimetype).
+    """
+    if not from_email:
+        from_email = getattr(settings, 'FROM_EMAIL')
+
+    subject = loader.render_to_string(subject_template_name, context)
+
+    # Email subject *must not* contain newlines
+    subject = ''.join(subject.splitlines())
+    body = loader.render_to_string(email_template_name, context)
+
+    html_body = None
+    if html_email_template_name is not None:
+        html_body = loader.render_to_string(html_email_template_name, context)
+
+    headers = {}
+
+    if mandrill_template:
+        headers["X-MC-Template"] = mandrill_template
+
+    if mandrill_variables:
+        headers["X-MC-MergeVars"] = json.dumps(mandrill_variables)
+
+    with transaction.atomic():
+        email = OutgoingEmail.objects.create(
+            subject=subject,
+            body=body,
+            html_body=html_body,
+            from_email=from_email,
+            to=[to_email],
+            cc=list(cc),
+            headers=headers,
+        )
+        OutgoingEmailAttachment.objects.bulk_create([
+            OutgoingEmailAttachment(
+                email=email,
+                filename=filename,
+                content=content,
+                mimetype=mimetype
+            ) for filename, content, mimetype in attachments
+        ])
+
+    return email
+
+
+def _build_message(email, connection):
+    message = EmailMultiAlternatives(
+        email.subject, email.body, email.from_email, email.to,
+        headers=email.headers, cc=email.cc, connection=connection)
+
+    if email.html_body is not None:
+        message.attach_alternative(email.html_body, 'text/html')
+
+    for attachment in email.attachments.all():
+        message.attach(attachment.filename, bytes(attachment.content),
+                       attachment.mimetype)
+
+    return message
+
+
+def _get_backoff(attempts):
+    backoff = getattr(settings, 'OUTBOX_BACKOFF_SECONDS', BACKOFF_SECONDS)
+    return timedelta(seconds=min(backoff * 2 ** (attempts - 1),
+                                 MAX_BACKOFF_SECONDS))
+
+
+def _fail(email, error, max_attempts):
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= max_attempts:
+        email.status = 'failed'
+    else:
+        email.status = 'queued'
+        email.next_attempt_at = timezone.now() + _get_backoff(email.attempts)
+    email.save(update_fields=[
+        'attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def requeue_stale_mail(max_attempts=None):
+    """
+    Puts back messages left in sending by a worker that died after claiming
+    them, the lost try counts as an attempt. Returns the number of rows.
+    """
+    max_attempts = max_attempts or getattr(
+        settings, 'OUTBOX_MAX_ATTEMPTS', MAX_ATTEMPTS)
+    now = timezone.now()
+    lease = timedelta(seconds=getattr(
+        settings, 'OUTBOX_LEASE_SECONDS', LEASE_SECONDS))
+    stale = OutgoingEmail.objects.filter(
+        Q(claimed_at__lt=now - lease) | Q(claimed_at__isnull=True),
+        status='sending')
+    changes = {
+        'attempts': F('attempts') + 1,
+        'last_error': 'Lease expired while sending',
+        'claimed_at': None,
+    }
+    failed = stale.filter(attempts__gte=max_attempts - 1).update(
+        status='failed', **changes)
+    queued = stale.update(status='queued', next_attempt_at=now, **changes)
+    return failed + queued
+
+
+def send_queued_mail(batch_size=100, backend=None):
+    """
+    Sends due messages over one reused connection. Failed messages are
+    retried with exponential backoff until OUTBOX_MAX_ATTEMPTS.
+
+    The connection uses OUTBOX_EMAIL_BACKEND, falling back to EMAIL_BACKEND,
+    so the file or console backend can stand in for the relay.
+    """
+    max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', MAX_ATTEMPTS)
+    requeue_stale_mail(max_attempts)
+    now = timezone.now()
+
+    # claim a batch, skip rows another worker is holding
+    with transaction.atomic():
+        ids = list(OutgoingEmail.objects.select_for_update(
+            skip_locked=True
+        ).filter(
+            status='queued',
+            next_attempt_at__lte=now
+        ).order_by('next_attempt_at').values_list('id', flat=True)[:batch_size])
+        OutgoingEmail.objects.filter(id__in=ids).update(
+            status='sending', claimed_at=now)
+
+    if not ids:
+        return {'sent': 0, 'failed': 0}
+
+    emails = OutgoingEmail.objects.filter(
+        id__in=ids).prefetch_related('attachments')
+    connection = get_connection(
+        backend or getattr(settings, 'OUTBOX_EMAIL_BACKEND', None))
+
+    sent = []
+    failed = 0
+    try:
+        try:
+            connection.open()
+        except Exception as e:
+            for email in emails:
+                _fail(email, e, max_attempts)
+            return {'sent': 0, 'failed': len(ids)}
+
+        for email in emails:
+            try:
+                _build_message(email, connection).send()
+            except Exception as e:
+                failed += 1
+                _fail(email, e, max_attempts)
+            else:
+                sent.append(email.id)
+    finally:
+        connection.close()
+        OutgoingEmail.objects.filter(id__in=sent).update(
+            status='sent', sent_at=timezone.now())
+        # anything left in sending (e.g. an unexpected error) goes back to
+        # the queue
+        OutgoingEmail.objects.filter(id__in=ids, status='sending').exclude(
+            id__in=sent).update(status='queued')
+
+    return {'sent': len(sent), 'failed': failed}
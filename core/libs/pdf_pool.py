@@ -0,0 +1,88 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+
+
+# per process state, parsed once by the initializer in pool workers and on
+# first use when rendering inline
+_font_config = None
+_stylesheets = None
+_init_lock = threading.Lock()
+
+
+def _init_worker(stylesheets):
+    global _font_config, _stylesheets
+    from weasyprint import CSS
+    from weasyprint.fonts import FontConfiguration
+
+    font_config = FontConfiguration()
+    _stylesheets = [CSS(filename=filename, font_config=font_config)
+                    for filename in stylesheets]
+    _font_config = font_config
+
+
+def write_pdf(html_string, base_url=None):
+    """
+    Renders with PDF_STYLESHEETS and a shared font configuration, pool
+    workers and inline renders produce the same document
+    """
+    from weasyprint import HTML
+
+    if _font_config is None:
+        with _init_lock:
+            if _font_config is None:
+                _init_worker(getattr(settings, 'PDF_STYLESHEETS', []))
+
+    html = HTML(string=html_string, base_url=base_url)
+    return html.write_pdf(stylesheets=_stylesheets, font_config=_font_config)
+
+
+class PDFPool(object):
+    """
+    WeasyPrint rendering on a pool of warm worker processes. At most
+    `max_queue` documents are pending at once, further submissions wait
+    `timeout` seconds for a free slot.
+    """
+
+    def __init__(self, workers=None, max_queue=None, timeout=None, stylesheets=None):
+        self.workers = workers or getattr(
+            settings, 'PDF_POOL_WORKERS', None) or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(stylesheets or getattr(settings, 'PDF_STYLESHEETS', []),)
+        )
+        self.max_queue = max_queue or getattr(
+            settings, 'PDF_POOL_MAX_QUEUE', self.workers * 4)
+        self.timeout = timeout or getattr(settings, 'PDF_POOL_TIMEOUT', 60)
+        self.slots = threading.BoundedSemaphore(self.max_queue)
+
+    def submit(self, html_string, base_url=None):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise Exception("PDF render queue is full (%d)" % self.max_queue)
+        try:
+            future = self.executor.submit(write_pdf, html_string, base_url)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda f: self.slots.release())
+        return future
+
+    def wait(self, future, timeout=None):
+        return future.result(timeout=timeout or self.timeout)
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pdf_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PDFPool()
+    return _pool
@@ -2,6 +2,7 @@ from rest_framework.permissions import *
 from enterprise.libs.rest_module.authentication import *
 from django.utils.translation import gettext_lazy as _
 from enterprise.structures.authentication.models import PhoneVerification, EmailVerification
+from core.libs.verification import get_verification_status
 
 class IsVerified(BasePermission):
     """
@@ -14,11 +15,7 @@ class IsVerified(BasePermission):
         if not is_authenticated:
             return False
 
-        ev = EmailVerification.objects.filter(email=request.user.email).last()
-        pv = PhoneVerification.objects.filter(phone_number=request.user.phone_number).last()
-
-        pv_verified = pv.is_verified if pv else False
-        ev_verified = ev.is_verified if ev else False
+        ev_verified, pv_verified = get_verification_status(request.user)
 
         if not pv_verified:
             return False
@@ -0,0 +1,105 @@
+import threading
+import uuid
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.utils.module_loading import import_string
+from django.utils.translation import gettext_lazy as _
+
+
+class BaseVerificationBackend(object):
+    """
+    Phone verification backend, both methods return the Verify API response
+    dict: `status` is '0' on success, otherwise `error_text` tells why
+    """
+
+    def start_verification(self, number, brand):
+        raise NotImplementedError
+
+    def check_verification(self, request_id, code):
+        raise NotImplementedError
+
+
+class NexmoBackend(BaseVerificationBackend):
+    """
+    Nexmo Verify API over one pooled https session, kept for the life of
+    the process
+    """
+    API_URL = 'https://api.nexmo.com/verify'
+
+    def __init__(self, key=None, secret=None, timeout=None, pool_size=None):
+        self.key = key or settings.NEXMO_API_KEY
+        self.secret = secret or settings.NEXMO_API_SECRET
+        self.timeout = timeout or getattr(settings, 'SMS_VERIFICATION_TIMEOUT', 10)
+
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size or getattr(
+                settings, 'SMS_VERIFICATION_POOL_SIZE', 10)
+        ))
+
+    def _post(self, path, params):
+        params.update({
+            'api_key': self.key,
+            'api_secret': self.secret,
+        })
+        try:
+            response = self.session.post(
+                '%s/%s' % (self.API_URL, path), data=params,
+                timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        except (requests.RequestException, ValueError):
+            return {
+                'status': 'error',
+                'error_text': _('Verification service is unavailable, please try again'),
+            }
+
+    def start_verification(self, number, brand):
+        return self._post('json', {'number': number, 'brand': brand})
+
+    def check_verification(self, request_id, code):
+        return self._post('check/json', {'request_id': request_id, 'code': code})
+
+
+class LocalBackend(BaseVerificationBackend):
+    """
+    In memory backend for tests and local development, the code is always
+    SMS_VERIFICATION_LOCAL_CODE
+    """
+
+    def __init__(self, code=None):
+        self.code = str(code or getattr(
+            settings, 'SMS_VERIFICATION_LOCAL_CODE', '1234'))
+        self.requests = {}
+
+    def start_verification(self, number, brand):
+        request_id = uuid.uuid4().hex
+        self.requests[request_id] = number
+        return {'status': '0', 'request_id': request_id}
+
+    def check_verification(self, request_id, code):
+        if request_id not in self.requests:
+            return {'status': '6', 'error_text': _('The verification request was not found')}
+        if str(code) != self.code:
+            return {'status': '16', 'error_text': _('The code provided does not match the expected value')}
+        del self.requests[request_id]
+        return {'status': '0', 'request_id': request_id}
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_sms_gateway():
+    """
+    Returns the process wide SMS_VERIFICATION_BACKEND instance
+    """
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            backend = import_string(getattr(
+                settings, 'SMS_VERIFICATION_BACKEND', 'core.libs.sms.NexmoBackend'))
+            _gateway = backend()
+    return _gateway
@@ -0,0 +1,55 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import caches
+
+from enterprise.structures.authentication.models import PhoneVerification, EmailVerification
+
+
+def get_verification_cache():
+    return caches[getattr(settings, 'VERIFICATION_CACHE', 'default')]
+
+
+def get_email_key(email):
+    return 'verification:email:%s' % hashlib.md5(
+        (email or '').encode('utf-8')).hexdigest()
+
+
+def get_phone_key(phone_number):
+    return 'verification:phone:%s' % hashlib.md5(
+        (phone_number or '').encode('utf-8')).hexdigest()
+
+
+def get_verification_status(user):
+    """
+    Returns (email verified, phone verified) of the user, cached for
+    VERIFICATION_CACHE_TIMEOUT seconds and invalidated when either
+    verification record is saved or deleted
+    """
+    cache = get_verification_cache()
+    email_key = get_email_key(user.email)
+    phone_key = get_phone_key(user.phone_number)
+    status = cache.get_many([email_key, phone_key])
+
+    missing = {}
+    if email_key not in status:
+        ev = EmailVerification.objects.filter(email=user.email).last()
+        missing[email_key] = ev.is_verified if ev else False
+    if phone_key not in status:
+        pv = PhoneVerification.objects.filter(
+            phone_number=user.phone_number).last()
+        missing[phone_key] = pv.is_verified if pv else False
+
+    if missing:
+        cache.set_many(missing, getattr(
+            settings, 'VERIFICATION_CACHE_TIMEOUT', 60))
+        status.update(missing)
+
+    return status[email_key], status[phone_key]
+
+
+def invalidate_email_verification(email):
+    get_verification_cache().delete(get_email_key(email))
+
+
+def invalidate_phone_verification(phone_number):
+    get_verification_cache().delete(get_phone_key(phone_number))
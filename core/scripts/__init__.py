@@ -24,22 +24,63 @@ from core.scripts.administrative import *
 
 
 def import_bank():
+    """
+    Syncs the bank catalog with BANK_CHOICES by code: missing banks are bulk
+    created, banks whose display name changed are bulk updated. Runs in one
+    transaction and returns the diff.
+    """
+    from django.db import transaction
     from enterprise.libs.pay_constants import BANK_CHOICES
     from enterprise.structures.authentication.models import User
+    from enterprise.structures.transaction.models import Bank
     from slugify import slugify
+    from core.libs.bulk import bulk_create_generic
 
-    user, created = User.objects.get_or_create(
-        full_name='Admin',
-        email='admin@investx.id',
-        phone_number='6281111'
-    )
-    for b in BANK_CHOICES:
-        display_name = b[1]
-        short_name = slugify(display_name)
-        code = b[0]
-        Bank.objects.get_or_create(
-            display_name=display_name,
-            short_name=short_name,
-            code=code,
-            created_by=user
-        )
+    with transaction.atomic():
+        banks = {}
+        for bank in Bank.objects.filter(
+                code__in=[b[0] for b in BANK_CHOICES]).order_by('pk'):
+            banks.setdefault(bank.code, bank)
+
+        created = []
+        updated = []
+        for code, display_name in BANK_CHOICES:
+            bank = banks.get(code)
+            if not bank:
+                created.append(Bank(
+                    display_name=display_name,
+                    short_name=slugify(display_name),
+                    code=code
+                ))
+            elif bank.display_name != display_name:
+                updated.append((code, bank.display_name, display_name))
+                bank.display_name = display_name
+                bank.short_name = slugify(display_name)
+
+        if created:
+            user, _ = User.objects.get_or_create(
+                full_name='Admin',
+                email='admin@investx.id',
+                phone_number='6281111'
+            )
+            for bank in created:
+                bank.created_by = user
+            bulk_create_generic(Bank, created)
+
+        if updated:
+            Bank.objects.bulk_update(
+                [banks[code] for code, old, new in updated],
+                ['display_name', 'short_name']
+            )
+
+    for bank in created:
+        print(f'+ {bank.code}: {bank.display_name}')
+    for code, old, new in updated:
+        print(f'~ {code}: {old} -> {new}')
+    print(f'Banks: {len(created)} created, {len(updated)} updated, '
+          f'{len(BANK_CHOICES) - len(created) - len(updated)} unchanged.')
+
+    return {
+        'created': [bank.code for bank in created],
+        'updated': updated,
+    }
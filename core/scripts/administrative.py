@@ -19,36 +19,116 @@
 
 import csv
 import os
-from ..structures.account.models import Province, Regency
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from ..structures.account.models import (Province, Regency,
+                                         invalidate_administrative_index)
 
 csv_directory = '%s/scripts/csv' % os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-def import_provices():
-    with open('%s/provinces.csv' % csv_directory, mode='r') as csv_file:
+
+def read_reference_csv(file_name, columns):
+    """
+    Streams a csv file and yields (line number, values), `columns` maps
+    every csv column to a (model field, cast) pair
+    """
+    with open(file_name, mode='r') as csv_file:
         csv_reader = csv.DictReader(csv_file)
-        line_count = 0
-        for row in csv_reader:
-            id = row['ID']
-            name = row['PROVINCE']
-            Province.objects.get_or_create(
-                id=id,
-                name=name
-            )
-            line_count += 1
-        print(f'Processed {line_count} lines.')
+        missing = set(columns) - set(csv_reader.fieldnames or [])
+        if missing:
+            raise Exception('%s is missing columns: %s' % (
+                file_name, ', '.join(sorted(missing))))
+
+        for line, row in enumerate(csv_reader, start=2):
+            values = {}
+            for column, (field, cast) in columns.items():
+                raw = (row[column] or '').strip()
+                if not raw:
+                    raise Exception('%s:%d %s is empty' % (
+                        file_name, line, column))
+                try:
+                    values[field] = cast(raw)
+                except ValueError:
+                    raise Exception('%s:%d invalid %s "%s"' % (
+                        file_name, line, column, raw))
+            yield line, values
+
+
+def load_reference_data(model, file_name, columns, validate=None, batch_size=500):
+    """
+    Idempotent csv loader for small reference tables. Rows are diffed by
+    primary key against the table in one query, then missing rows are bulk
+    inserted and changed rows bulk updated in one transaction.
+    """
+    rows = {}
+    for line, values in read_reference_csv(file_name, columns):
+        if validate:
+            validate(line, values)
+        if values['id'] in rows:
+            raise Exception('%s:%d duplicate id %s' % (
+                file_name, line, values['id']))
+        rows[values['id']] = values
+
+    fields = [field for field, cast in columns.values() if field != 'id']
+    existing = model.objects.in_bulk(list(rows))
+
+    to_create = []
+    to_update = []
+    for pk, values in rows.items():
+        obj = existing.get(pk)
+        if obj is None:
+            to_create.append(model(**values))
+        elif any(getattr(obj, field) != values[field] for field in fields):
+            for field in fields:
+                setattr(obj, field, values[field])
+            to_update.append(obj)
+
+    with transaction.atomic():
+        model.objects.bulk_create(
+            to_create, batch_size=batch_size, ignore_conflicts=True)
+        model.objects.bulk_update(to_update, fields, batch_size=batch_size)
+
+        if to_create:
+            # ids come from the csv, move the sequence past them
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [model]):
+                    cursor.execute(sql)
+
+    if to_create or to_update:
+        # bulk writes do not send post_save
+        invalidate_administrative_index(model)
+
+    print(f'{model.__name__}: {len(to_create)} created, {len(to_update)} updated, '
+          f'{len(rows) - len(to_create) - len(to_update)} unchanged.')
+    return len(to_create), len(to_update)
+
+
+def import_provices():
+    return load_reference_data(
+        Province,
+        '%s/provinces.csv' % csv_directory,
+        {
+            'ID': ('id', int),
+            'PROVINCE': ('name', str),
+        }
+    )
+
 
 def import_regencies():
-    with open('%s/regencies.csv' % csv_directory, mode='r') as csv_file:
-        csv_reader = csv.DictReader(csv_file)
-        line_count = 0
-        for row in csv_reader:
-            id = row['ID']
-            province_id = row['PROVINCE_ID']
-            name = row['REGENCY']
-            Regency.objects.get_or_create(
-                id=id,
-                province_id=province_id,
-                name=name
-            )
-            line_count += 1
-        print(f'Processed {line_count} lines.')
\ No newline at end of file
+    province_ids = set(Province.objects.values_list('id', flat=True))
+
+    def validate(line, values):
+        if values['province_id'] not in province_ids:
+            raise Exception('regencies.csv:%d unknown province %s' % (
+                line, values['province_id']))
+
+    return load_reference_data(
+        Regency,
+        '%s/regencies.csv' % csv_directory,
+        {
+            'ID': ('id', int),
+            'PROVINCE_ID': ('province_id', int),
+            'REGENCY': ('name', str),
+        },
+        validate=validate
+    )
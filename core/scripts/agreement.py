@@ -16,12 +16,158 @@
 # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 '''
 
-from core.structures.project.models import Project
-from ..libs.agreement import generate_ma, generate_pa
+import json
+import os
+from django.db import transaction
+from django.db.models import F, Prefetch
+from django.db.models.functions import Mod
 
+from core.libs.bulk import bulk_create_generic
+from core.structures.account.models import Address, Company, Profile
+from core.structures.project.models import (Project, Fund, MasterAgreement,
+                                            ParticipationAgreement)
+from enterprise.structures.transaction.models import BankAccount
 
-def generate_agreement_data():
-    for project in Project.objects.all():
-        generate_ma(project)
-        for fund in project.fund_set.all():
-            generate_pa(fund)
+
+def _read_checkpoint(checkpoint_file):
+    if not checkpoint_file or not os.path.exists(checkpoint_file):
+        return 0
+    with open(checkpoint_file, mode='r') as f:
+        return json.load(f).get('last_project_id', 0)
+
+
+def _write_checkpoint(checkpoint_file, last_project_id):
+    if not checkpoint_file:
+        return
+    tmp_file = '%s.tmp' % checkpoint_file
+    with open(tmp_file, mode='w') as f:
+        json.dump({'last_project_id': last_project_id}, f)
+    os.replace(tmp_file, checkpoint_file)
+
+
+def _first_by(objs, key):
+    # objs ordered by pk, keeps the first object of every key
+    result = {}
+    for obj in objs:
+        result.setdefault(getattr(obj, key), obj)
+    return result
+
+
+def _last_by(objs, key):
+    # objs ordered by pk, keeps the last object of every key
+    return {getattr(obj, key): obj for obj in objs}
+
+
+def _get_profile_addresses(user_ids):
+    profiles = Profile.objects.filter(
+        created_by_id__in=user_ids
+    ).prefetch_related(Prefetch(
+        'addresses', queryset=Address.objects.order_by('pk')))
+
+    addresses = {}
+    for profile in profiles:
+        address = next(iter(profile.addresses.all()), None)
+        addresses[profile.created_by_id] = address
+    return addresses
+
+
+def _generate_ma_bulk(projects):
+    """
+    Same result as generate_ma for every project, with a fixed number of
+    queries for the whole chunk
+    """
+    mas = list(MasterAgreement.objects.filter(
+        project__in=projects).order_by('pk'))
+    first_mas = _first_by(mas, 'project_id')
+
+    missing = [p for p in projects if p.pk not in first_mas]
+    if missing:
+        borrower_ids = set(p.owned_by_id for p in missing)
+        companies = _last_by(Company.objects.filter(
+            owned_by_id__in=borrower_ids
+        ).prefetch_related(Prefetch(
+            'addresses', queryset=Address.objects.order_by('pk')
+        )).order_by('pk'), 'owned_by_id')
+        addresses = _get_profile_addresses(borrower_ids)
+
+        new_mas = []
+        for project in missing:
+            company = companies.get(project.owned_by_id)
+            address = None
+            if company:
+                address = next(iter(company.addresses.all()), None)
+            if not address:
+                address = addresses.get(project.owned_by_id)
+            new_mas.append(MasterAgreement(
+                project=project,
+                created_by_id=project.owned_by_id,
+                company=company,
+                address=address
+            ))
+        mas += bulk_create_generic(MasterAgreement, new_mas)
+
+    return len(missing), _last_by(mas, 'project_id')
+
+
+def _generate_pa_bulk(projects, last_mas):
+    """
+    Same result as generate_pa for every fund of the projects
+    """
+    existing = set(ParticipationAgreement.objects.filter(
+        fund__project__in=projects
+    ).values_list('fund_id', flat=True))
+    funds = [f for f in Fund.objects.filter(
+        project__in=projects).order_by('pk') if f.pk not in existing]
+    if not funds:
+        return 0
+
+    lender_ids = set(f.owned_by_id for f in funds)
+    bank_accounts = _last_by(BankAccount.objects.filter(
+        owned_by_id__in=lender_ids).order_by('pk'), 'owned_by_id')
+    addresses = _get_profile_addresses(lender_ids)
+
+    bulk_create_generic(ParticipationAgreement, [
+        ParticipationAgreement(
+            ma=last_mas.get(fund.project_id),
+            fund=fund,
+            created_by_id=fund.owned_by_id,
+            address=addresses.get(fund.owned_by_id),
+            bank_account=bank_accounts.get(fund.owned_by_id),
+        ) for fund in funds
+    ])
+    return len(funds)
+
+
+def generate_agreement_data(chunk_size=500, checkpoint_file=None, shard=None):
+    """
+    Creates missing master and participation agreements chunk by chunk.
+    The last finished project id is saved to `checkpoint_file`, a rerun
+    resumes from there. `shard` (index, count) splits the projects by id so
+    several processes can run in parallel, each with its own checkpoint.
+    """
+    projects = Project.objects.order_by('pk')
+    if shard:
+        index, count = shard
+        projects = projects.annotate(
+            shard=Mod(F('pk'), count)).filter(shard=index)
+
+    last_project_id = _read_checkpoint(checkpoint_file)
+    total = projects.filter(pk__gt=last_project_id).count()
+    done = 0
+    ma_count = 0
+    pa_count = 0
+
+    while True:
+        chunk = list(projects.filter(pk__gt=last_project_id)[:chunk_size])
+        if not chunk:
+            break
+
+        with transaction.atomic():
+            created, last_mas = _generate_ma_bulk(chunk)
+            ma_count += created
+            pa_count += _generate_pa_bulk(chunk, last_mas)
+
+        last_project_id = chunk[-1].pk
+        _write_checkpoint(checkpoint_file, last_project_id)
+        done += len(chunk)
+        print(f'Processed {done}/{total} projects, created {ma_count} MA and {pa_count} PA.')
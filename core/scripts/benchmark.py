@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+import time
+
+package_directory = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _run(code, runs):
+    timings = []
+    for i in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True,
+                       cwd=package_directory)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def benchmark_constant_import(runs=5):
+    """
+    Cold start of a process importing core.libs.constant, with the pycountry
+    choices left lazy and with all of them materialized (the old behaviour)
+    """
+    baseline = _run('import django.utils.translation', runs)
+    lazy = _run('import core.libs.constant', runs)
+    eager = _run(
+        'import core.libs.constant as c\n'
+        'for choices in (c.COUNTRY_CHOICES, c.COUNTRY_KEYS, '
+        'c.CURRENCY_CHOICES, c.LANGUAGE_CHOICES):\n'
+        '    len(choices)', runs)
+
+    print(f'interpreter + django:    {baseline * 1000:.1f} ms')
+    print(f'constant, lazy choices:  {lazy * 1000:.1f} ms')
+    print(f'constant, eager choices: {eager * 1000:.1f} ms')
+    print(f'saved per process:       {(eager - lazy) * 1000:.1f} ms')
+    return {'baseline': baseline, 'lazy': lazy, 'eager': eager}
+
+
+def benchmark_campaign_codes(count=100000, block_size=1000):
+    """
+    Allocates `count` campaign codes from a scratch sequence and checks they
+    are unique, the sequence row is removed afterwards
+    """
+    from core.libs.generate_campaign_code import CodeAllocator
+    from core.structures.investment.models import CodeSequence
+
+    name = 'benchmark-%d' % os.getpid()
+    allocator = CodeAllocator(name=name, block_size=block_size)
+    try:
+        start = time.perf_counter()
+        codes = [allocator.allocate() for i in range(count)]
+        elapsed = time.perf_counter() - start
+    finally:
+        CodeSequence.objects.filter(name=name).delete()
+
+    unique = len(set(codes))
+    print(f'allocated:  {count} codes, {unique} unique')
+    print(f'elapsed:    {elapsed * 1000:.1f} ms')
+    print(f'throughput: {count / elapsed:.0f} codes/s')
+    return {'count': count, 'unique': unique, 'elapsed': elapsed}
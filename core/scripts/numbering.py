@@ -15,20 +15,60 @@
 # Copyright - 2019 PT Bima Kapital Asia Teknologi, bimaasia.id
 # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 '''
+from django.db import transaction
+
 from core.structures.project.models import *
 
 
-def regenerate_numbering():
-    for l in Project.objects.all():
-        l.number = ''
-        l.save(create_number=False)
-    for l in Project.objects.all():
-        l.save()
-        print(l.get_number())
-
-        for f in l.fund_set.all():
-            f.number = ''
-            f.save(create_number=False)
-        for f in l.fund_set.all():
-            f.save()
-            print('---%s' % (f.get_number()))
+def _get_numbers():
+    numbers = {}
+    for model in (Project, Fund):
+        for pk, number in model.objects.values_list('pk', 'number').iterator():
+            numbers[(model.__name__, pk)] = number
+    return numbers
+
+
+def _regenerate(chunk_size):
+    """
+    Numbers come from the models' own save(), which numbers rows without
+    one. All project numbers are cleared first, then each project is saved
+    in order followed by its funds, as before.
+    """
+    project_count = 0
+    fund_count = 0
+    Project.objects.update(number='')
+    for project in Project.objects.order_by('pk').iterator(chunk_size=chunk_size):
+        with transaction.atomic():
+            project.save()
+            project.fund_set.update(number='')
+            for fund in project.fund_set.order_by('pk'):
+                fund.save()
+                fund_count += 1
+        project_count += 1
+    return project_count, fund_count
+
+
+def regenerate_numbering(chunk_size=1000, dry_run=False):
+    """
+    Regenerates project and fund numbers reading projects in chunks instead
+    of loading them all. With `dry_run` the run is rolled back and the
+    changed numbers are printed and returned.
+    """
+    if not dry_run:
+        project_count, fund_count = _regenerate(chunk_size)
+        print(f'Renumbered {project_count} projects and {fund_count} funds.')
+        return []
+
+    with transaction.atomic():
+        before = _get_numbers()
+        project_count, fund_count = _regenerate(chunk_size)
+        after = _get_numbers()
+        transaction.set_rollback(True)
+
+    diff = [(name, pk, number, after.get((name, pk)))
+            for (name, pk), number in before.items()
+            if number != after.get((name, pk))]
+    for name, pk, old, new in diff:
+        print(f'{name} {pk}: {old} -> {new}')
+    print(f'Would renumber {project_count} projects and {fund_count} funds.')
+    return diff
@@ -0,0 +1,20 @@
+import json
+
+from core.libs.constant import PYCOUNTRY_SNAPSHOT
+
+
+def build_pycountry_snapshot(file_name=PYCOUNTRY_SNAPSHOT):
+    """
+    Writes (alpha_3, name) of pycountry countries, currencies and languages
+    to a compact json file, which core.libs.constant then loads instead of
+    the pycountry databases
+    """
+    import pycountry
+
+    snapshot = {
+        name: [(item.alpha_3, item.name) for item in getattr(pycountry, name)]
+        for name in ('countries', 'currencies', 'languages')
+    }
+    with open(file_name, mode='w') as f:
+        json.dump(snapshot, f, separators=(',', ':'))
+    print(f'Written {file_name}.')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.scripts.administrative import import_provices, import_regencies
+
+
+class Command(BaseCommand):
+    help = 'Load provinces and regencies from the bundled csv files'
+
+    def handle(self, *args, **options):
+        import_provices()
+        import_regencies()
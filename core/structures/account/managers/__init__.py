@@ -0,0 +1,37 @@
+from django.db import models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from enterprise.structures.transaction.models import TopUp, Wallet, Withdraw
+
+
+def _sum_amount(model, **filters):
+    total = model.objects.filter(
+        created_by_id=OuterRef('created_by_id'),
+        **filters
+    ).order_by().values('created_by_id').annotate(
+        total=Sum('amount')
+    ).values('total')
+    return Coalesce(
+        Subquery(total, output_field=models.DecimalField(
+            max_digits=19, decimal_places=2)),
+        Value(0),
+        output_field=models.DecimalField(max_digits=19, decimal_places=2)
+    )
+
+
+class ProfileQuerySet(models.QuerySet):
+    def with_financial_summary(self):
+        """
+        Annotates total top up, cash balance and total withdraw of every
+        profile in the same query
+        """
+        return self.annotate(
+            total_topup_amount=_sum_amount(TopUp, status='success'),
+            cash_balance_amount=_sum_amount(Wallet),
+            total_withdraw_amount=_sum_amount(Withdraw),
+        )
+
+
+class ProfileManager(models.Manager.from_queryset(ProfileQuerySet)):
+    pass
@@ -1,25 +1,38 @@
+import uuid
 from random import randint
 from datetime import date
-from django.db import models
-from django.db.models.signals import pre_save, post_save
+from django.db import models, transaction
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.utils.text import slugify
 from django.contrib.gis.db import models as geo
 from django.contrib.postgres.fields import ArrayField
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
+from django.core.cache import cache
 
 from enterprise.structures.common.models import File
 from enterprise.structures.common.models.base import BaseModelGeneric, BaseModelUnique
-from enterprise.structures.authentication.models import User, EmailVerification
-from enterprise.structures.transaction.models import BankAccount
+from enterprise.structures.authentication.models import User, EmailVerification, PhoneVerification
+from enterprise.structures.transaction.models import BankAccount, TopUp, Wallet, Withdraw
 from enterprise.libs import storage
 
 from core.libs import constant
+from core.libs.choices import ChoiceLabelMixin, get_choices_labels
+from core.libs.verification import (invalidate_email_verification,
+                                    invalidate_phone_verification)
+from core.structures.account.managers import ProfileManager
 
 User = settings.AUTH_USER_MODEL
 
 
+ADMINISTRATIVE_VERSION_KEY = 'administrative_index_version'
+
+
+def get_financial_summary_cache_key(user_id):
+    return 'profile_financial_summary:%s' % user_id
+
+
 class Province(models.Model):
     name = models.CharField(max_length=255)
 
@@ -59,6 +72,14 @@ class Address(BaseModelGeneric):
     def __str__(self):
         return self.address
 
+    def get_province(self):
+        from core.libs.administrative import administrative_index
+        return administrative_index.get_province(self.province_id)
+
+    def get_regency(self):
+        from core.libs.administrative import administrative_index
+        return administrative_index.get_regency(self.regency_id)
+
     class Meta:
         verbose_name = _('Address')
         verbose_name_plural = _('Addresses')
@@ -85,7 +106,7 @@ class Phone(BaseModelGeneric):
         verbose_name_plural = _('Phones')
 
 
-class Profile(BaseModelUnique):
+class Profile(ChoiceLabelMixin, BaseModelUnique):
     nick_name = models.CharField(_('nick name'), max_length=150, blank=True, null=True)
     avatar = models.FileField(
         max_length=300,
@@ -155,6 +176,8 @@ class Profile(BaseModelUnique):
     information_source = models.PositiveIntegerField(
         choices=constant.INFORMATION_SOURCE_CHOICES, default=1)
 
+    objects = ProfileManager()
+
     def __str__(self):
         return self.owned_by.nick_name
 
@@ -171,10 +194,10 @@ class Profile(BaseModelUnique):
             return '-'
 
     def get_gender(self):
-        return dict(constant.GENDER_CHOICES)[self.gender]
+        return get_choices_labels('GENDER_CHOICES')[self.gender]
 
     def get_type(self):
-        return dict(constant.PROFILE_TYPE_CHOICES)[self.type]
+        return get_choices_labels('PROFILE_TYPE_CHOICES')[self.type]
 
     def get_number(self, *args, **kwargs):
         return str(self.pk).zfill(5)
@@ -183,45 +206,60 @@ class Profile(BaseModelUnique):
         today = date.today()
         return today.year - self.birth_date.year
 
+    def get_financial_summary(self):
+        """
+        Returns total top up, cash balance and total withdraw, read from
+        the queryset annotation or the per user cache when available
+        """
+        if hasattr(self, 'total_topup_amount'):
+            return {
+                'total_topup': self.total_topup_amount,
+                'cash_balance': self.cash_balance_amount,
+                'total_withdraw': self.total_withdraw_amount,
+            }
+
+        key = get_financial_summary_cache_key(self.created_by_id)
+        summary = cache.get(key)
+        if summary is None:
+            summary = Profile.objects.filter(
+                pk=self.pk
+            ).with_financial_summary().values(
+                'total_topup_amount',
+                'cash_balance_amount',
+                'total_withdraw_amount'
+            ).first() or {}
+            summary = {
+                'total_topup': summary.get('total_topup_amount') or 0,
+                'cash_balance': summary.get('cash_balance_amount') or 0,
+                'total_withdraw': summary.get('total_withdraw_amount') or 0,
+            }
+            cache.set(key, summary, getattr(
+                settings, 'FINANCIAL_SUMMARY_CACHE_TIMEOUT', 300))
+        return summary
+
     def get_total_topup(self):
-        from enterprise.structures.transaction.models import TopUp
-        total_topup = TopUp.objects.filter(
-            created_by_id=self.created_by_id,
-            status='success'
-        ).aggregate(
-            models.Sum('amount')
-        )['amount__sum']
+        total_topup = self.get_financial_summary()['total_topup']
         if total_topup:
             return 'Rp.{:,.0f},-'.format(int(total_topup))
         else:
             return 'Rp.{:,.0f},-'.format(0)
 
     def get_cash_balance(self):
-        from enterprise.structures.transaction.models import Wallet
-        cash_balance = Wallet.objects.filter(
-            created_by_id=self.created_by_id
-        ).aggregate(
-            models.Sum('amount')
-        )['amount__sum']
+        cash_balance = self.get_financial_summary()['cash_balance']
         if cash_balance:
             return 'Rp.{:,.0f},-'.format(int(cash_balance))
         else:
             return 'Rp.{:,.0f},-'.format(0)
 
     def get_total_withdraw(self):
-        from enterprise.structures.transaction.models import Withdraw
-        total_withdraw = Withdraw.objects.filter(
-            created_by_id=self.created_by_id
-        ).aggregate(
-            models.Sum('amount')
-        )['amount__sum']
+        total_withdraw = self.get_financial_summary()['total_withdraw']
         if total_withdraw:
             return 'Rp.{:,.0f},-'.format(int(total_withdraw))
         else:
             return 'Rp.{:,.0f},-'.format(0)
 
 
-class Company(BaseModelGeneric):
+class Company(ChoiceLabelMixin, BaseModelGeneric):
     # General
     name = models.CharField(max_length=150, blank=True, null=True)
     trademark = models.CharField(max_length=150, blank=True, null=True)
@@ -314,3 +352,35 @@ class Favorite(BaseModelGeneric):
     class Meta:
         verbose_name = _('Favorite')
         verbose_name_plural = _('Favorites')
+
+
+@receiver(post_save, sender=TopUp)
+@receiver(post_save, sender=Wallet)
+@receiver(post_save, sender=Withdraw)
+@receiver(post_delete, sender=TopUp)
+@receiver(post_delete, sender=Wallet)
+@receiver(post_delete, sender=Withdraw)
+def invalidate_financial_summary(sender, instance, **kwargs):
+    # after commit, a read before it would cache the old totals again
+    key = get_financial_summary_cache_key(instance.created_by_id)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+@receiver(post_save, sender=Province)
+@receiver(post_save, sender=Regency)
+@receiver(post_delete, sender=Province)
+@receiver(post_delete, sender=Regency)
+def invalidate_administrative_index(sender, **kwargs):
+    cache.set(ADMINISTRATIVE_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+@receiver(post_save, sender=EmailVerification)
+@receiver(post_delete, sender=EmailVerification)
+def invalidate_email_verification_status(sender, instance, **kwargs):
+    invalidate_email_verification(instance.email)
+
+
+@receiver(post_save, sender=PhoneVerification)
+@receiver(post_delete, sender=PhoneVerification)
+def invalidate_phone_verification_status(sender, instance, **kwargs):
+    invalidate_phone_verification(instance.phone_number)
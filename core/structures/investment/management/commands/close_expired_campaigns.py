@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from core.structures.investment.models import close_expired_campaigns
+
+
+class Command(BaseCommand):
+    help = 'Close campaigns whose deadline passed since the last run'
+
+    def handle(self, *args, **options):
+        metrics = close_expired_campaigns()
+        self.stdout.write(
+            'Closed %(completed)d funded and %(expired)d expired campaigns'
+            % metrics)
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from core.structures.investment.models import dedupe_campaign_codes
+
+
+class Command(BaseCommand):
+    help = ('Make campaign codes unique, run before migrating the unique '
+            'index on CompanyCampaign.code')
+
+    def handle(self, *args, **options):
+        total = dedupe_campaign_codes()
+        self.stdout.write('Changed %d campaign codes' % total)
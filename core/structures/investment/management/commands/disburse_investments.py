@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from core.structures.investment.models import CompanyCampaign, disburse_campaigns
+
+
+class Command(BaseCommand):
+    help = 'Disburse raised investment of completed campaigns to their companies'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--campaign', type=int, action='append', dest='campaigns',
+            help='Only disburse this campaign id (repeatable)')
+        parser.add_argument(
+            '--shard', type=int, nargs=2, metavar=('INDEX', 'COUNT'),
+            help='Only disburse campaigns with id %% COUNT == INDEX')
+
+    def handle(self, *args, **options):
+        campaigns = None
+        if options['campaigns']:
+            campaigns = CompanyCampaign.objects.filter(pk__in=options['campaigns'])
+
+        metrics = disburse_campaigns(campaigns=campaigns, shard=options['shard'])
+        self.stdout.write(
+            'Disbursed %(disbursed)d campaigns (%(amount)s), %(duplicate)d '
+            'already disbursed, %(pending)d below target, %(failed)d failed '
+            'in %(elapsed).1fs' % metrics)
@@ -0,0 +1,23 @@
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+
+from core.structures.account.models import Company
+from core.structures.investment.models import distribute_dividend
+
+
+class Command(BaseCommand):
+    help = 'Distribute a dividend over the investors of a company'
+
+    def add_arguments(self, parser):
+        parser.add_argument('company', type=int, help='Company id')
+        parser.add_argument('amount', type=Decimal, help='Total dividend amount')
+        parser.add_argument('--description', default='Dividend')
+
+    def handle(self, *args, **options):
+        company = Company.objects.get(pk=options['company'])
+        distribution = distribute_dividend(
+            company, options['amount'], description=options['description'])
+        self.stdout.write(
+            'Distributed %s to %d investors (%d investments)' % (
+                distribution.amount, distribution.investor_count,
+                distribution.investment_count))
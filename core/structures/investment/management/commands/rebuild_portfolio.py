@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from core.structures.investment.models import rebuild_portfolio
+
+
+class Command(BaseCommand):
+    help = 'Rebuild investor portfolio holdings from investments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='Only rebuild holdings of this user id (repeatable)')
+
+    def handle(self, *args, **options):
+        total = rebuild_portfolio(users=options['users'])
+        self.stdout.write('Rebuilt %d portfolio holdings' % total)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from core.structures.investment.models import rebuild_raised
+
+
+class Command(BaseCommand):
+    help = 'Rebuild raised amount, investor count and shares sold counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--company', type=int, action='append', dest='companies',
+            help='Only rebuild counters of this company id (repeatable)')
+
+    def handle(self, *args, **options):
+        total = rebuild_raised(companies=options['companies'])
+        self.stdout.write('Rebuilt %d raised counters' % total)
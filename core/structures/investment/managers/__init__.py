@@ -0,0 +1,105 @@
+from datetime import timedelta
+from django.db import models
+from django.db.models import (
+    Count, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value)
+from django.db.models.functions import Cast, Coalesce, NullIf, Now
+
+
+DEFAULT_TIME_LIMIT = 60
+
+
+def campaign_time_limit():
+    """
+    Days a campaign runs, its own time_limit or the one of its company
+    """
+    return Coalesce(F('time_limit'), F('company__time_limit'),
+                    Value(DEFAULT_TIME_LIMIT),
+                    output_field=models.IntegerField())
+
+
+def _investment_total(expression, **filters):
+    from core.structures.investment.models import Investment
+
+    total = Investment.objects.filter(
+        campaign_id=OuterRef('pk'),
+        deleted_at__isnull=True,
+        **filters
+    ).order_by().values('campaign_id').annotate(
+        total=expression
+    ).values('total')
+    return Subquery(total, output_field=models.BigIntegerField())
+
+
+class CompanyCampaignQuerySet(models.QuerySet):
+    def with_progress(self):
+        """
+        Annotates raised amount, shares sold, investor count, remaining
+        shares, percentage funded and time remaining of every campaign in
+        the same query. Raised values come from the campaign counter, or
+        from the investments when the counter does not exist yet.
+        """
+        ends_at = ExpressionWrapper(
+            F('started') + ExpressionWrapper(
+                campaign_time_limit() * Value(timedelta(days=1)),
+                output_field=models.DurationField()),
+            output_field=models.DateTimeField())
+        target_amount = Coalesce(
+            # both columns are int4, their product would overflow it
+            NullIf(Cast('shares', models.BigIntegerField()) *
+                   Cast('price_per_share', models.BigIntegerField()), Value(0)),
+            F('company__investment_needed'),
+            output_field=models.BigIntegerField())
+
+        return self.annotate(
+            raised_amount=Coalesce(
+                F('raised__amount'), _investment_total(Sum('amount')), Value(0),
+                output_field=models.BigIntegerField()),
+            shares_sold=Coalesce(
+                F('raised__shares'), _investment_total(Sum('shares')), Value(0),
+                output_field=models.BigIntegerField()),
+            investor_count=Coalesce(
+                F('raised__investor_count'),
+                _investment_total(Count('user_id', distinct=True)), Value(0),
+                output_field=models.IntegerField()),
+            target_amount=target_amount,
+            ends_at=ends_at,
+        ).annotate(
+            remaining_shares=ExpressionWrapper(
+                F('shares') - F('shares_sold'),
+                output_field=models.BigIntegerField()),
+            percentage_funded=ExpressionWrapper(
+                F('raised_amount') * Value(100.0) / NullIf(
+                    F('target_amount'), Value(0)),
+                output_field=models.FloatField()),
+            time_remaining=ExpressionWrapper(
+                F('ends_at') - Now(), output_field=models.DurationField()),
+        )
+
+
+class CompanyCampaignManager(models.Manager.from_queryset(CompanyCampaignQuerySet)):
+    pass
+
+
+class PortfolioHoldingQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """
+        Holdings of one user with company and campaign joined, campaign
+        status is read from the joined row. Investors from before the
+        portfolio existed get their holdings on their next investment change
+        or from the rebuild_portfolio command.
+        """
+        return self.filter(user=user).select_related(
+            'company', 'campaign').order_by('company_id', 'campaign_id')
+
+    def summary(self):
+        totals = self.aggregate(
+            total_amount=Sum('amount'),
+            total_shares=Sum('shares'),
+            total_dividend=Sum('dividend'),
+            company_count=Count('company_id', distinct=True),
+        )
+        return {key: value or 0 for key, value in totals.items()}
+
+
+class PortfolioHoldingManager(models.Manager.from_queryset(PortfolioHoldingQuerySet)):
+    pass
@@ -1,11 +1,18 @@
+import logging
+import time
 from random import randint
-from datetime import date
-from django.db import models
-from django.db.models.signals import pre_save, post_save
+from datetime import date, timedelta
+from django.db import models, transaction
+from django.db.models import F, Sum, Count, Max, Case, When, Value
+from django.db.models.functions import Mod
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
 from django.utils.text import slugify
 from django.contrib.gis.db import models as geo
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 
@@ -15,16 +22,27 @@ from enterprise.structures.authentication.models import User, EmailVerification
 from enterprise.structures.transaction.models import BankAccount
 from enterprise.libs.payment.wallet import *
 
-from core.structures.account.models import Company
+from core.structures.account.models import Company, get_financial_summary_cache_key
 from enterprise.libs import storage
 from enterprise.libs.payment.wallet import *
+from enterprise.libs.moment import to_timestamp
 
 from core.libs import constant
+from core.libs.allocation import allocate_pro_rata, sum_by_key
+from core.libs.bulk import bulk_create_generic
+from core.libs.decimal_lib import round_decimal
+from core.libs.generate_campaign_code import (
+    CODE_LENGTH, allocate_campaign_code, generate_campaign_code)
+from core.structures.investment.managers import (
+    CompanyCampaignManager, PortfolioHoldingManager, campaign_time_limit)
+
+
+logger = logging.getLogger(__name__)
 
 
 class CompanyCampaign(BaseModelGeneric):
     company = models.ForeignKey(Company, on_delete=models.CASCADE)
-    code = models.CharField(max_length=6, blank=True, null=True)
+    code = models.CharField(max_length=6, blank=True, null=True, unique=True)
     status = models.PositiveIntegerField(
         choices=constant.CAMPAIGN_STATUS_CHOICES, default=1)
     started = models.DateTimeField(db_index=True)
@@ -32,12 +50,24 @@ class CompanyCampaign(BaseModelGeneric):
     shares = models.IntegerField(blank=True, null=True)
     price_per_share = models.IntegerField(blank=True, null=True)
 
+    objects = CompanyCampaignManager()
+
     def __str__(self):
         return self.company.name
 
     def get_investment(self, obj):
         return Investment.objects.filter(campaign=obj).all()
 
+    def get_raised(self):
+        if hasattr(self, 'raised_amount'):
+            return self.raised_amount
+        return get_campaign_raised(self)
+
+    def save(self, *args, **kwargs):
+        if not self.code:
+            self.code = allocate_campaign_code()
+        return super(CompanyCampaign, self).save(*args, **kwargs)
+
     class Meta:
         verbose_name = _("Company Campaign")
         verbose_name_plural = _("Company Campaigns")
@@ -66,34 +96,714 @@ class Investment(BaseModelGeneric):
     def __str__(self):
         return f"{self.created_by}: {self.campaign}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # keep loaded values so counters can be adjusted by delta on save
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     class Meta:
         verbose_name = _("Investment")
         verbose_name_plural = _("Investments")
+        constraints = [
+            models.UniqueConstraint(
+                fields=['nonce'], condition=models.Q(nonce__isnull=False),
+                name='investment_unique_nonce'),
+        ]
+
+
+class CodeSequence(models.Model):
+    name = models.CharField(max_length=32, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+    class Meta:
+        verbose_name = _("Code Sequence")
+        verbose_name_plural = _("Code Sequences")
+
+
+class _RaisedCounter(models.Model):
+    amount = models.BigIntegerField(default=0)
+    investor_count = models.PositiveIntegerField(default=0)
+    shares = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+
+class CompanyRaised(_RaisedCounter):
+    company = models.OneToOneField(Company, on_delete=models.CASCADE,
+                                   related_name='raised')
+
+    def __str__(self):
+        return f"{self.company}: {self.amount}"
+
+    class Meta:
+        verbose_name = _("Company Raised")
+        verbose_name_plural = _("Company Raised")
+
+
+class CampaignRaised(_RaisedCounter):
+    campaign = models.OneToOneField(CompanyCampaign, on_delete=models.CASCADE,
+                                    related_name='raised')
+
+    def __str__(self):
+        return f"{self.campaign}: {self.amount}"
+
+    class Meta:
+        verbose_name = _("Campaign Raised")
+        verbose_name_plural = _("Campaign Raised")
+
+
+class Disbursement(models.Model):
+    key = models.CharField(max_length=100, unique=True)
+    company = models.ForeignKey(Company, on_delete=models.CASCADE,
+                                related_name='disbursements')
+    campaign = models.ForeignKey(CompanyCampaign, on_delete=models.CASCADE,
+                                 null=True, blank=True,
+                                 related_name='disbursements')
+    content_type = models.ForeignKey(
+        ContentType, on_delete=models.CASCADE, blank=True, null=True)
+    object_id = models.PositiveIntegerField(blank=True, null=True)
+    amount = models.DecimalField(max_digits=19, decimal_places=2)
+    wallet = models.OneToOneField(Wallet, on_delete=models.PROTECT,
+                                  related_name='disbursement')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.company}: {self.amount}"
+
+    class Meta:
+        verbose_name = _("Disbursement")
+        verbose_name_plural = _("Disbursements")
+
+
+class CampaignAction(models.Model):
+    campaign = models.ForeignKey(CompanyCampaign, on_delete=models.CASCADE,
+                                 related_name='actions')
+    action = models.CharField(
+        max_length=20, choices=constant.CAMPAIGN_ACTION_CHOICES)
+    status = models.CharField(
+        max_length=10, choices=constant.CAMPAIGN_ACTION_STATUS_CHOICES,
+        default='queued', db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.campaign}: {self.action}"
+
+    class Meta:
+        verbose_name = _("Campaign Action")
+        verbose_name_plural = _("Campaign Actions")
+        constraints = [
+            models.UniqueConstraint(
+                fields=['campaign', 'action'], name='campaign_action_unique'),
+        ]
+
+
+class Watermark(models.Model):
+    name = models.CharField(max_length=32, unique=True)
+    value = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+    class Meta:
+        verbose_name = _("Watermark")
+        verbose_name_plural = _("Watermarks")
+
+
+class DividendDistribution(models.Model):
+    company = models.ForeignKey(Company, on_delete=models.CASCADE,
+                                related_name='dividends')
+    amount = models.DecimalField(max_digits=19, decimal_places=2)
+    investment_count = models.PositiveIntegerField(default=0)
+    investor_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.company}: {self.amount}"
+
+    class Meta:
+        verbose_name = _("Dividend Distribution")
+        verbose_name_plural = _("Dividend Distributions")
+
+
+class PortfolioHolding(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='portfolio')
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    campaign = models.ForeignKey(CompanyCampaign, on_delete=models.CASCADE,
+                                 null=True, blank=True)
+    amount = models.BigIntegerField(default=0)
+    shares = models.BigIntegerField(default=0)
+    dividend = models.BigIntegerField(default=0)
+    investment_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = PortfolioHoldingManager()
+
+    def __str__(self):
+        return f"{self.user}: {self.company} ({self.shares})"
+
+    class Meta:
+        verbose_name = _("Portfolio Holding")
+        verbose_name_plural = _("Portfolio Holdings")
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'company', 'campaign'],
+                condition=models.Q(campaign__isnull=False),
+                name='portfolio_holding_unique'),
+            models.UniqueConstraint(
+                fields=['user', 'company'],
+                condition=models.Q(campaign__isnull=True),
+                name='portfolio_holding_unique_no_campaign'),
+        ]
+
+
+# counter model and the Investment column it is keyed by
+RAISED_COUNTERS = (
+    (CompanyRaised, 'company_id'),
+    (CampaignRaised, 'campaign_id'),
+)
+CONTRIBUTION_FIELDS = ('company_id', 'campaign_id', 'user_id', 'amount', 'shares')
+# investment values kept on the instance to diff counters and holdings
+TRACKED_FIELDS = CONTRIBUTION_FIELDS + ('dividend', 'deleted_at')
+
+
+def _get_contribution(values):
+    if values is None or values.get('deleted_at') is not None:
+        return None
+    return {name: values.get(name) for name in CONTRIBUTION_FIELDS}
+
+
+def _has_other_investment(instance, key, target_id, user_id):
+    return Investment.objects.filter(
+        deleted_at__isnull=True,
+        user_id=user_id,
+        **{key: target_id}
+    ).exclude(pk=instance.pk).exists()
+
+
+def _update_raised(instance, before, after, create=True):
+    before = _get_contribution(before)
+    after = _get_contribution(after)
+    if before == after:
+        return
+
+    with transaction.atomic():
+        for counter_model, key in RAISED_COUNTERS:
+            deltas = {}
+            if before and before[key]:
+                delta = deltas.setdefault(before[key], [0, 0, 0])
+                delta[0] -= before['amount'] or 0
+                delta[1] -= before['shares'] or 0
+            if after and after[key]:
+                delta = deltas.setdefault(after[key], [0, 0, 0])
+                delta[0] += after['amount'] or 0
+                delta[1] += after['shares'] or 0
+
+            # investor count only moves when the (target, user) pair changes
+            key_before = (before[key], before['user_id']) if before else None
+            key_after = (after[key], after['user_id']) if after else None
+            if key_before != key_after:
+                for pair, sign in ((key_before, -1), (key_after, 1)):
+                    if pair and all(pair) and not _has_other_investment(
+                            instance, key, *pair):
+                        deltas[pair[0]][2] += sign
+
+            for target_id, (amount, shares, investors) in deltas.items():
+                if not (amount or shares or investors):
+                    continue
+                counters = counter_model.objects.filter(**{key: target_id})
+                changes = {
+                    'amount': F('amount') + amount,
+                    'shares': F('shares') + shares,
+                    'investor_count': F('investor_count') + investors,
+                }
+                # a new counter starts from the saved investments, which
+                # already include this change. One created concurrently may
+                # have been seeded without it.
+                if not counters.update(**changes) and create and \
+                        not _seed_raised(counter_model, key, target_id):
+                    counters.update(**changes)
+
+
+def rebuild_raised(companies=None):
+    """
+    Rebuild raised counters from the investment table, for all companies
+    or only the given ones
+    """
+    investments = Investment.objects.filter(deleted_at__isnull=True)
+    if companies is not None:
+        investments = investments.filter(company__in=companies)
+
+    total = 0
+    with transaction.atomic():
+        for counter_model, key in RAISED_COUNTERS:
+            counters = counter_model.objects.all()
+            if companies is not None:
+                if key == 'company_id':
+                    counters = counters.filter(company__in=companies)
+                else:
+                    counters = counters.filter(campaign__company__in=companies)
+            counters.delete()
+
+            objs = [counter_model(**{key: row[key]}, **_get_raised_values(row))
+                    for row in _get_raised_rows(investments, key)]
+            counter_model.objects.bulk_create(objs, batch_size=1000)
+            total += len(objs)
+    return total
+
+
+def _get_raised_rows(investments, key):
+    return investments.filter(
+        **{'%s__isnull' % key: False}
+    ).values(key).annotate(
+        raised_amount=Sum('amount'),
+        raised_shares=Sum('shares'),
+        investors=Count('user', distinct=True),
+    ).order_by()
+
+
+def _get_raised_values(row):
+    return {
+        'amount': row['raised_amount'] or 0,
+        'shares': row['raised_shares'] or 0,
+        'investor_count': row['investors'],
+    }
+
+
+def _seed_raised(counter_model, key, target_id):
+    # not first(), ordering by pk would split the group
+    rows = list(_get_raised_rows(Investment.objects.filter(
+        deleted_at__isnull=True, **{key: target_id}), key))
+    row = rows[0] if rows else None
+    counter, created = counter_model.objects.get_or_create(
+        defaults=_get_raised_values(row) if row else {}, **{key: target_id})
+    return created
+
+
+def dedupe_campaign_codes():
+    """
+    Makes CompanyCampaign.code unique, run it before migrating the unique
+    index. Empty codes become NULL and all but the oldest campaign sharing
+    a code get a new random one. Returns the number of changed campaigns.
+    """
+    campaigns = CompanyCampaign.objects.all()
+    changed = campaigns.filter(code='').update(code=None)
+
+    used = set(campaigns.exclude(
+        code__isnull=True).values_list('code', flat=True))
+    duplicates = campaigns.exclude(code__isnull=True).order_by().values(
+        'code').annotate(count=Count('id')).filter(count__gt=1)
+    for row in duplicates:
+        ids = campaigns.filter(
+            code=row['code']).order_by('pk').values_list('pk', flat=True)
+        for pk in list(ids)[1:]:
+            code = generate_campaign_code(CODE_LENGTH)
+            while code in used:
+                code = generate_campaign_code(CODE_LENGTH)
+            used.add(code)
+            campaigns.filter(pk=pk).update(code=code)
+            changed += 1
+    return changed
+
+
+def _get_holding(values):
+    if values is None or values.get('deleted_at') is not None \
+            or not values.get('user_id') or not values.get('company_id'):
+        return None
+    return {name: values.get(name) for name in TRACKED_FIELDS}
+
+
+def _update_portfolio(before, after, create=True):
+    before = _get_holding(before)
+    after = _get_holding(after)
+    if before == after:
+        return
+
+    deltas = {}
+    for values, sign in ((before, -1), (after, 1)):
+        if values:
+            key = (values['user_id'], values['company_id'], values['campaign_id'])
+            delta = deltas.setdefault(key, [0, 0, 0, 0])
+            delta[0] += sign * (values['amount'] or 0)
+            delta[1] += sign * (values['shares'] or 0)
+            delta[2] += sign * (values.get('dividend') or 0)
+            delta[3] += sign
+
+    with transaction.atomic():
+        rebuilt = set()
+        # lock investors in a fixed order
+        for (user_id, company_id, campaign_id), delta in sorted(
+                deltas.items(), key=lambda item: item[0][0]):
+            if not any(delta) or user_id in rebuilt:
+                continue
+            lookup = {'user_id': user_id, 'company_id': company_id,
+                      'campaign_id': campaign_id}
+            holdings = PortfolioHolding.objects.filter(**lookup)
+            changes = {
+                'amount': F('amount') + delta[0],
+                'shares': F('shares') + delta[1],
+                'dividend': F('dividend') + delta[2],
+                'investment_count': F('investment_count') + delta[3],
+            }
+            if not holdings.update(**changes) and create:
+                # serialize seeding per investor, concurrent rebuilds would
+                # both insert the same holdings
+                list(User.objects.select_for_update().filter(
+                    pk=user_id).values_list('pk', flat=True))
+                if not PortfolioHolding.objects.filter(user_id=user_id).exists():
+                    # investor from before the portfolio existed, build all
+                    # of their holdings, this change included
+                    rebuild_portfolio(users=[user_id])
+                    rebuilt.add(user_id)
+                    continue
+                # a new holding starts from the saved investments, one
+                # created concurrently may have been seeded without them
+                if not _seed_holding(lookup):
+                    holdings.update(**changes)
+            if delta[3] < 0:
+                holdings.filter(investment_count__lte=0).delete()
+
+
+def _get_holding_rows(investments):
+    return investments.values('user_id', 'company_id', 'campaign_id').annotate(
+        total_amount=Sum('amount'),
+        total_shares=Sum('shares'),
+        total_dividend=Sum('dividend'),
+        total_count=Count('id'),
+    ).order_by()
+
+
+def _get_holding_values(row):
+    return {
+        'amount': row['total_amount'] or 0,
+        'shares': row['total_shares'] or 0,
+        'dividend': row['total_dividend'] or 0,
+        'investment_count': row['total_count'],
+    }
+
+
+def _seed_holding(lookup):
+    # not first(), ordering by pk would split the group
+    rows = list(_get_holding_rows(Investment.objects.filter(
+        deleted_at__isnull=True, **lookup)))
+    holding, created = PortfolioHolding.objects.get_or_create(
+        defaults=_get_holding_values(rows[0]) if rows else {}, **lookup)
+    return created
+
+
+def rebuild_portfolio(users=None, companies=None):
+    """
+    Rebuild portfolio holdings from the investment table, for all users or
+    only the given users and/or companies
+    """
+    investments = Investment.objects.filter(
+        deleted_at__isnull=True, user__isnull=False, company__isnull=False)
+    holdings = PortfolioHolding.objects.all()
+    if users is not None:
+        investments = investments.filter(user__in=users)
+        holdings = holdings.filter(user__in=users)
+    if companies is not None:
+        investments = investments.filter(company__in=companies)
+        holdings = holdings.filter(company__in=companies)
+
+    with transaction.atomic():
+        holdings.delete()
+        objs = PortfolioHolding.objects.bulk_create([PortfolioHolding(
+            user_id=row['user_id'],
+            company_id=row['company_id'],
+            campaign_id=row['campaign_id'],
+            **_get_holding_values(row)
+        ) for row in _get_holding_rows(investments)], batch_size=1000)
+    return len(objs)
 
 
 def get_raised(company):
-    investment = Investment.objects.filter(company=company, deleted_at__isnull=True).all()
-    amount = sum([x.amount for x in investment])
-    return amount
+    counter = CompanyRaised.objects.filter(company=company).first()
+    if counter:
+        return counter.amount
+    return Investment.objects.filter(
+        company=company, deleted_at__isnull=True
+    ).aggregate(Sum('amount'))['amount__sum'] or 0
+
+
+def get_campaign_raised(campaign):
+    counter = CampaignRaised.objects.filter(campaign=campaign).first()
+    if counter:
+        return counter.amount
+    return Investment.objects.filter(
+        campaign=campaign, deleted_at__isnull=True
+    ).aggregate(Sum('amount'))['amount__sum'] or 0
+
 
+def get_disbursement_key(company, campaign=None):
+    # keyed on what is paid out only, the source object is kept on the row
+    return 'campaign.%s' % campaign.pk if campaign else 'company.%s' % company.pk
 
-def give_investment(company, obj=None, description="Addition"):
-    amount = get_raised(company)
-    needed = company.investment_needed
-    if amount < needed:
+
+def _disburse(company, campaign=None, obj=None, description="Addition"):
+    """
+    Returns (disbursement, created), (None, False) when the target is not
+    reached yet. A campaign or company is paid once whatever the source
+    object. The company row is locked until the wallet entry and its key
+    are committed, a concurrent trigger waits and then finds the key.
+    """
+    key = get_disbursement_key(company, campaign)
+    with transaction.atomic():
+        company = Company.objects.select_for_update().get(pk=company.pk)
+        disbursement = Disbursement.objects.filter(key=key).first()
+        if disbursement:
+            return disbursement, False
+
+        # a company payout covers all of its campaigns and the other way round
+        overlapping = company.disbursements.all()
+        if campaign:
+            overlapping = overlapping.filter(campaign__isnull=True)
+        disbursement = overlapping.first()
+        if disbursement:
+            return disbursement, False
+
+        if campaign:
+            amount = get_campaign_raised(campaign)
+            needed = (campaign.shares or 0) * (campaign.price_per_share or 0) \
+                or company.investment_needed
+        else:
+            amount = get_raised(company)
+            needed = company.investment_needed
+        if amount < (needed or 0):
+            return None, False
+
+        wallet = Wallet()
+        wallet.created_by = company.owned_by
+        wallet.amount = abs(amount)
+        wallet.description = description
+        if obj:
+            wallet.content_type = obj.get_content_type()
+            wallet.object_id = obj.id
+        wallet.save()
+
+        disbursement = Disbursement.objects.create(
+            key=key,
+            company=company,
+            campaign=campaign,
+            content_type=wallet.content_type,
+            object_id=wallet.object_id,
+            amount=wallet.amount,
+            wallet=wallet,
+        )
+    return disbursement, True
+
+
+def give_investment(company, obj=None, description="Addition", campaign=None):
+    disbursement, created = _disburse(company, campaign, obj, description)
+    if disbursement is None:
         raise Exception("Target not reached yet")
-    # if current_balance < amount:
-    #     raise Exception("Insufficient balance %d:%d" % (current_balance, amount))
-
-    # deduct first
-    wallet = Wallet()
-    wallet.created_by = company
-    wallet.amount = amount * -1 if amount < 0 else amount
-    wallet.description = description
-    if obj:
-        wallet.content_type = obj.get_content_type()
-        wallet.object_id = obj.id
-    wallet.save()
-    print("Investment sent (%s)" % amount)
-    print(wallet)
-    return True
+    logger.info('investment disbursed', extra={
+        'company_id': company.pk,
+        'campaign_id': campaign.pk if campaign else None,
+        'amount': disbursement.amount,
+        'duplicate': not created,
+    })
+    return disbursement
+
+
+def disburse_campaigns(campaigns=None, description="Addition", shard=None):
+    """
+    Disburses completed campaigns which have no disbursement yet, each one
+    in its own transaction. `shard` (index, count) splits the campaigns by
+    id so several processes can run in parallel.
+    """
+    if campaigns is None:
+        campaigns = CompanyCampaign.objects.filter(
+            status=2, deleted_at__isnull=True, disbursements__isnull=True)
+    if shard:
+        index, count = shard
+        campaigns = campaigns.annotate(
+            shard=Mod(F('pk'), count)).filter(shard=index)
+
+    start = time.perf_counter()
+    metrics = {'disbursed': 0, 'duplicate': 0, 'pending': 0, 'failed': 0,
+               'amount': 0}
+    for campaign in campaigns.select_related('company').order_by('pk').iterator():
+        try:
+            disbursement, created = _disburse(
+                campaign.company, campaign, campaign, description)
+        except Exception:
+            metrics['failed'] += 1
+            logger.exception('campaign disbursement failed', extra={
+                'campaign_id': campaign.pk})
+            continue
+
+        if disbursement is None:
+            metrics['pending'] += 1
+            continue
+        elif created:
+            metrics['disbursed'] += 1
+            metrics['amount'] += disbursement.amount
+        else:
+            metrics['duplicate'] += 1
+        CampaignAction.objects.filter(
+            campaign=campaign, action='disbursement').update(status='done')
+
+    metrics['elapsed'] = time.perf_counter() - start
+    logger.info('campaign disbursement finished', extra=metrics)
+    return metrics
+
+
+def distribute_dividend(company, amount, description="Dividend"):
+    """
+    Splits `amount` over the company's investments pro rata to their shares
+    and credits every investor in one transaction. Investment.dividend is
+    an integer, so the amount must be whole, the units lost by rounding
+    down go to the largest remainders.
+    """
+    amount = round_decimal(amount)
+    if amount != amount.to_integral_value():
+        raise Exception("Dividend must be a whole amount (%s)" % amount)
+
+    start = time.perf_counter()
+    with transaction.atomic():
+        company = Company.objects.select_for_update().get(pk=company.pk)
+        investments = list(Investment.objects.select_for_update().filter(
+            company=company, deleted_at__isnull=True,
+            user__isnull=False, shares__gt=0
+        ).only('id', 'user_id', 'shares', 'dividend').order_by('pk'))
+        if not investments:
+            raise Exception("Company has no investors")
+
+        parts = allocate_pro_rata(
+            int(amount), [investment.shares for investment in investments])
+        for investment, part in zip(investments, parts.tolist()):
+            investment.dividend = (investment.dividend or 0) + part
+        Investment.objects.bulk_update(investments, ['dividend'], batch_size=1000)
+
+        user_ids, totals = sum_by_key(
+            [investment.user_id for investment in investments], parts)
+        distribution = DividendDistribution.objects.create(
+            company=company,
+            amount=amount,
+            investment_count=len(investments),
+            investor_count=len(user_ids),
+        )
+        content_type = ContentType.objects.get_for_model(distribution)
+        bulk_create_generic(Wallet, [Wallet(
+            created_by_id=user_id,
+            amount=round_decimal(total),
+            description=description,
+            content_type=content_type,
+            object_id=distribution.pk,
+        ) for user_id, total in zip(user_ids.tolist(), totals.tolist()) if total])
+
+        # bulk writes skip the signals keeping these in sync
+        rebuild_portfolio(companies=[company.pk])
+        transaction.on_commit(lambda: cache.delete_many([
+            get_financial_summary_cache_key(user_id)
+            for user_id in user_ids.tolist()]))
+
+    logger.info('dividend distributed', extra={
+        'company_id': company.pk,
+        'amount': amount,
+        'investment_count': distribution.investment_count,
+        'investor_count': distribution.investor_count,
+        'elapsed': time.perf_counter() - start,
+    })
+    return distribution
+
+
+def close_expired_campaigns(now=None):
+    """
+    Closes funding campaigns whose deadline passed. Only campaigns started
+    after the previous run minus the longest time limit are read, through
+    the started index. Funded campaigns become Complete and get a queued
+    disbursement, the others become Expired and get a queued refund.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        watermark, created = Watermark.objects.select_for_update(
+        ).get_or_create(name='campaign_expiry')
+
+        campaigns = CompanyCampaign.objects.filter(
+            status=1, deleted_at__isnull=True, started__lte=now)
+        if watermark.value:
+            days = campaigns.aggregate(
+                days=Max(campaign_time_limit()))['days'] or 0
+            campaigns = campaigns.filter(
+                started__gt=watermark.value - timedelta(days=days))
+
+        expired = list(campaigns.with_progress().filter(
+            ends_at__lte=now
+        ).values_list('pk', 'raised_amount', 'target_amount'))
+        completed = {pk for pk, raised, target in expired
+                     if raised >= (target or 0)}
+        expired_ids = [pk for pk, raised, target in expired]
+
+        CompanyCampaign.objects.filter(pk__in=expired_ids).update(
+            status=Case(When(pk__in=completed, then=Value(2)), default=Value(4)),
+            updated_at=now,
+            updated_at_timestamp=to_timestamp(now),
+        )
+        CampaignAction.objects.bulk_create([
+            CampaignAction(
+                campaign_id=pk,
+                action='disbursement' if pk in completed else 'refund'
+            ) for pk in expired_ids
+        ], ignore_conflicts=True)
+
+        watermark.value = now
+        watermark.save()
+
+    metrics = {
+        'completed': len(completed),
+        'expired': len(expired_ids) - len(completed),
+    }
+    logger.info('expired campaigns closed', extra=metrics)
+    return metrics
+
+
+def _get_loaded_values(instance):
+    values = getattr(instance, '_loaded_values', None)
+    if values is None or any(name not in values for name in TRACKED_FIELDS):
+        # loaded with only() or defer()
+        return None
+    return values
+
+
+@receiver(post_save, sender=Investment)
+def update_raised_on_save(sender, instance, created, **kwargs):
+    before = None if created else _get_loaded_values(instance)
+    after = {name: getattr(instance, name) for name in TRACKED_FIELDS}
+    if not created and before is None:
+        # instance was not (fully) loaded from db, counters can not be
+        # diffed safely
+        if instance.company_id:
+            rebuild_raised(companies=[instance.company_id])
+        if instance.user_id:
+            rebuild_portfolio(users=[instance.user_id])
+    else:
+        _update_raised(instance, before, after)
+        _update_portfolio(before, after)
+    instance._loaded_values = after
+
+
+@receiver(pre_delete, sender=Investment)
+def load_raised_values_on_delete(sender, instance, **kwargs):
+    if _get_loaded_values(instance) is None:
+        # deferred values can not be loaded once the row is gone
+        instance._loaded_values = Investment.objects.filter(
+            pk=instance.pk).values(*TRACKED_FIELDS).first()
+
+
+@receiver(post_delete, sender=Investment)
+def update_raised_on_delete(sender, instance, **kwargs):
+    before = _get_loaded_values(instance)
+    if before is None:
+        return
+    _update_raised(instance, before, None, create=False)
+    _update_portfolio(before, None, create=False)
@@ -0,0 +1,11 @@
+from django.contrib import admin
+from .models import OutgoingEmail
+
+
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'created_at',
+                    'sent_at')
+    list_filter = ('status',)
+
+
+admin.site.register(OutgoingEmail, OutgoingEmailAdmin)
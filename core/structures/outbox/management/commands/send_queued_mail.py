@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+
+from core.libs.outbox import send_queued_mail
+
+
+class Command(BaseCommand):
+    help = 'Send queued outgoing emails'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep polling the outbox instead of sending one batch')
+        parser.add_argument(
+            '--interval', type=float, default=5,
+            help='Seconds to sleep when the outbox is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            result = send_queued_mail(batch_size=options['batch_size'])
+            if result['sent'] or result['failed']:
+                self.stdout.write('Sent %(sent)d, failed %(failed)d' % result)
+            if not options['loop']:
+                break
+            if not (result['sent'] or result['failed']):
+                time.sleep(options['interval'])
@@ -0,0 +1,48 @@
+from django.db import models
+from django.contrib.postgres.fields import ArrayField, JSONField
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from core.libs import constant
+
+
+class OutgoingEmail(models.Model):
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True, null=True)
+    from_email = models.CharField(max_length=255)
+    to = ArrayField(models.CharField(max_length=255))
+    cc = ArrayField(models.CharField(max_length=255), blank=True, default=list)
+    headers = JSONField(blank=True, default=dict)
+
+    status = models.CharField(
+        max_length=10, choices=constant.EMAIL_STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return '%s: %s' % (', '.join(self.to), self.subject)
+
+    class Meta:
+        verbose_name = _('Outgoing Email')
+        verbose_name_plural = _('Outgoing Emails')
+        index_together = [('status', 'next_attempt_at')]
+
+
+class OutgoingEmailAttachment(models.Model):
+    email = models.ForeignKey(
+        OutgoingEmail, on_delete=models.CASCADE, related_name='attachments')
+    filename = models.CharField(max_length=255)
+    content = models.BinaryField()
+    mimetype = models.CharField(max_length=100, default='application/pdf')
+
+    def __str__(self):
+        return self.filename
+
+    class Meta:
+        verbose_name = _('Outgoing Email Attachment')
+        verbose_name_plural = _('Outgoing Email Attachments')